@@ -64,6 +64,8 @@ def show_logs():
         log_content = announcement_status()
     elif log_type == 'chromekiller':
         log_content = chromeKiller_status()
+    elif log_type == 'db_writer':
+        log_content = db_writer_status()
     else:
         log_content = "Select a log type above."
     return render_template('home.html', log_content=log_content)
@@ -93,6 +95,9 @@ def announcement_status():
 def chromeKiller_status():
     return read_log_file('chromeKiller.log')
 
+def db_writer_status():
+    return read_log_file('dbWriter.log')
+
 
 def read_log_file(file_name):
     file_path = os.path.join(logs_dir, file_name)
@@ -1,4 +1,7 @@
-
+import asyncio
+import os
+import time
+from urllib.parse import urlparse
 import psutil
 from pyppeteer import launch
 import logging
@@ -10,39 +13,104 @@ logger = logging.getLogger()
 
 broswer_path = r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe"
 browser_process = None
-browser_process_pids = []
+# Main browser PID -> PIDs of the whole Chrome process tree
+browser_process_pids = {}
+
+# Browser pool settings (per process)
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 1))
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', 50))
+BROWSER_MAX_AGE = int(os.getenv('BROWSER_MAX_AGE', 1800))  # seconds
+
+# Lean launch profile
+RENDERER_PROCESS_LIMIT = int(os.getenv('CHROME_RENDERER_LIMIT', 2))
+CHROME_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.chrome-cache')
+LEAN_ARGS = ['--disable-gpu', '--disable-extensions', '--disable-dev-shm-usage',
+             '--disable-background-networking', '--disable-default-apps',
+             '--no-first-run', '--mute-audio',
+             f'--renderer-process-limit={RENDERER_PROCESS_LIMIT}',
+             f'--disk-cache-dir={CHROME_CACHE_DIR}']
+
+# Resource types aborted per site; scripts, XHR and documents always load
+BLOCK_RESOURCES = os.getenv('BLOCK_RESOURCES', '1') == '1'
+BLOCKED_RESOURCE_TYPES = {
+    'default': {'image', 'media', 'font'},
+    'nepalstock.com.np': {'image', 'media', 'font', 'stylesheet'},
+}
+BLOCKED_DOMAINS = ['google-analytics.com', 'googletagmanager.com', 'doubleclick.net',
+                   'googlesyndication.com', 'adservice.google.com', 'facebook.net',
+                   'facebook.com', 'hotjar.com']
 
 async def create_browser():
-    global browser_process_pids
     browser = await launch(
         headless=True,
         executablePath=broswer_path,
         args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-infobars',
               '--window-position=0,0', '--ignore-certificate-errors',
-              '--ignore-certificate-errors-spki-list']
+              '--ignore-certificate-errors-spki-list'] + LEAN_ARGS
     )
     main_process = psutil.Process(browser.process.pid)
-    # Add the main browser PID
-    browser_process_pids.append(main_process.pid)
-    # Add child process PIDs (tabs, etc.)
+    # Add the main browser PID and child process PIDs (tabs, etc.)
+    pids = [main_process.pid]
     for child in main_process.children(recursive=True):
-        browser_process_pids.append(child.pid)
-    logger.info(f"Browser launched with PIDs: {browser_process_pids}")
+        pids.append(child.pid)
+    browser_process_pids[main_process.pid] = pids
+    logger.info(f"Browser launched with PIDs: {pids}")
     return browser
 
-async def close_browser(browser, page):
-    global browser_process_pids
+def _browser_pids(browser):
+    """
+    Returns the known PIDs of a browser plus any children spawned since launch.
+    """
+    if not browser or not browser.process:
+        return []
+    main_pid = browser.process.pid
+    pids = list(browser_process_pids.get(main_pid, [main_pid]))
+    try:
+        for child in psutil.Process(main_pid).children(recursive=True):
+            if child.pid not in pids:
+                pids.append(child.pid)
+    except psutil.NoSuchProcess:
+        pass
+    return pids
 
+def kill_browser_processes(pids):
+    for pid in pids:
+        try:
+            browser_process = psutil.Process(pid)
+            if browser_process.is_running():
+                try:
+                    browser_process.terminate()
+                    logger.info(f'Browser process {pid} terminated')
+                    try:
+                        browser_process.wait(timeout=5)
+                    except psutil.TimeoutExpired:
+                        logger.warning(f"Timeout expired while waiting for browser process {pid} to terminate. Killing process.")
+                        browser_process.kill()
+                        browser_process.wait(timeout=5)
+                        logger.info(f'Browser process {pid} killed')
+                except Exception as e:
+                    logger.error(f"Error terminating browser process {pid}: {e}")
+            else:
+                logger.info(f'Browser process {pid} already terminated')
+        except psutil.NoSuchProcess:
+            logger.info(f'Browser process {pid} does not exist')
+        except Exception as e:
+            logger.error(f"Error handling browser process {pid}: {e}")
+
+async def close_browser(browser, page):
     closed = False
+    pids = _browser_pids(browser)
 
     if browser:
         try:
             # Close the page first
-            try:
-                await page.close()
-                logger.info('Page closed')
-            except Exception as e:
-                logger.error(f"Error closing page: {e}")
+            if page is not None:
+                report_page_metrics(page)
+                try:
+                    await page.close()
+                    logger.info('Page closed')
+                except Exception as e:
+                    logger.error(f"Error closing page: {e}")
 
             # Attempt to close the browser gracefully
             try:
@@ -65,32 +133,10 @@ async def close_browser(browser, page):
     # If the browser didn't close gracefully, use forceful measures
     if not closed:
         logger.info('Attempting to close browser forcefully')
-
-        for pid in browser_process_pids:
-            try:
-                browser_process = psutil.Process(pid)
-                if browser_process.is_running():
-                    try:
-                        browser_process.terminate()
-                        logger.info(f'Browser process {pid} terminated')
-                        try:
-                            browser_process.wait(timeout=5)
-                        except psutil.TimeoutExpired:
-                            logger.warning(f"Timeout expired while waiting for browser process {pid} to terminate. Killing process.")
-                            browser_process.kill()
-                            browser_process.wait(timeout=5)
-                            logger.info(f'Browser process {pid} killed')
-                    except Exception as e:
-                        logger.error(f"Error terminating browser process {pid}: {e}")
-                else:
-                    logger.info(f'Browser process {pid} already terminated')
-            except psutil.NoSuchProcess:
-                logger.info(f'Browser process {pid} does not exist')
-            except Exception as e:
-                logger.error(f"Error handling browser process {pid}: {e}")
+        kill_browser_processes(pids)
 
     # Final check to ensure closure
-    for pid in browser_process_pids:
+    for pid in pids:
         try:
             browser_process = psutil.Process(pid)
             if browser_process.is_running():
@@ -100,6 +146,284 @@ async def close_browser(browser, page):
         except psutil.NoSuchProcess:
             logger.info(f"Final Check - Browser process {pid} does not exist")
 
-    # Clear the PID list
-    browser_process_pids = []
+    # Forget the PIDs of this browser
+    if browser and browser.process:
+        browser_process_pids.pop(browser.process.pid, None)
+
+
+class PageMetrics:
+    """
+    Bytes downloaded, blocked requests, load time and peak browser RSS for one page.
+    """
+    def __init__(self, page, browser, job_logger):
+        self.page = page
+        self.browser = browser
+        self.logger = job_logger or logger
+        self.bytes_downloaded = 0
+        self.requests = 0
+        self.blocked = 0
+        self.peak_rss = 0
+        self.started_at = time.monotonic()
+        self.load_time = None
+        self._sampler = None
+
+    async def start(self):
+        session = await self.page.target.createCDPSession()
+        await session.send('Network.enable')
+        session.on('Network.loadingFinished', self._on_loading_finished)
+        self.page.on('load', self._on_load)
+        self._sampler = asyncio.ensure_future(self._sample_rss())
+
+    def _on_loading_finished(self, event):
+        self.requests += 1
+        self.bytes_downloaded += int(event.get('encodedDataLength', 0))
+
+    def _on_load(self, *args):
+        self.load_time = time.monotonic() - self.started_at
+
+    def _sample_once(self):
+        rss = 0
+        for pid in _browser_pids(self.browser):
+            try:
+                rss += psutil.Process(pid).memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    async def _sample_rss(self):
+        while True:
+            self._sample_once()
+            await asyncio.sleep(1)
+
+    def report(self):
+        if self._sampler:
+            self._sampler.cancel()
+        self._sample_once()
+        load_time = f"{self.load_time:.2f}s" if self.load_time is not None else "n/a"
+        self.logger.info(f"Page metrics: {self.bytes_downloaded / 1024:.0f} KB downloaded in {self.requests} requests, "
+                         f"{self.blocked} requests blocked, load time {load_time}, "
+                         f"peak browser RSS {self.peak_rss / (1024 * 1024):.0f} MB")
+
+
+# Page -> PageMetrics, reported when the page is closed on release
+page_metrics = {}
+
+def _blocked_types(site_url):
+    host = urlparse(site_url).hostname or ''
+    for site, types in BLOCKED_RESOURCE_TYPES.items():
+        if host == site or host.endswith('.' + site):
+            return types
+    return BLOCKED_RESOURCE_TYPES['default']
+
+async def new_page(browser, site_url, job_logger=None):
+    """
+    Opens a page with the site's resource blocking applied and metrics tracking started.
+    """
+    page = await browser.newPage()
+    metrics = PageMetrics(page, browser, job_logger)
+    page_metrics[page] = metrics
+
+    if BLOCK_RESOURCES:
+        blocked_types = _blocked_types(site_url)
+
+        async def intercept(request):
+            host = urlparse(request.url).hostname or ''
+            try:
+                if request.resourceType in blocked_types or any(host.endswith(domain) for domain in BLOCKED_DOMAINS):
+                    metrics.blocked += 1
+                    await request.abort()
+                else:
+                    await request.continue_()
+            except Exception as e:
+                logger.debug(f"Request interception error for {request.url}: {e}")
+
+        await page.setRequestInterception(True)
+        page.on('request', lambda request: asyncio.ensure_future(intercept(request)))
+
+    try:
+        await metrics.start()
+    except Exception as e:
+        logger.error(f"Error starting page metrics: {e}")
+    return page
+
+def report_page_metrics(page):
+    metrics = page_metrics.pop(page, None)
+    if metrics:
+        metrics.report()
+
+def _drop_page_metrics(browser):
+    for page, metrics in list(page_metrics.items()):
+        if metrics.browser is browser:
+            report_page_metrics(page)
+
+
+class PooledBrowser:
+    """
+    A warm browser kept by the pool, with the usage counters used for recycling.
+    """
+    def __init__(self, browser):
+        self.browser = browser
+        self.created_at = time.monotonic()
+        self.pages_served = 0
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created_at
+
+
+class BrowserPool:
+    """
+    Keeps up to `size` warm Chrome instances and leases them out to callers.
+
+    A browser goes back to the pool on release and is recycled once it has
+    served `max_pages` pages or is older than `max_age` seconds. Browsers are
+    bound to the event loop that launched them, so jobs should drive the pool
+    through `run_async()` to keep one loop per process.
+    """
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES, max_age=BROWSER_MAX_AGE):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self._idle = []
+        self._leased = {}
+        self._loop = None
+        self._slots = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Browsers launched on another (closed) loop cannot be driven from this one
+        for entry in self._idle + list(self._leased.values()):
+            _drop_page_metrics(entry.browser)
+            kill_browser_processes(_browser_pids(entry.browser))
+            browser_process_pids.pop(entry.browser.process.pid, None)
+        self._idle = []
+        self._leased = {}
+        self._loop = loop
+        self._slots = asyncio.Semaphore(self.size)
+
+    def _expired(self, entry):
+        return entry.pages_served >= self.max_pages or entry.age >= self.max_age
+
+    async def _healthy(self, entry):
+        process = entry.browser.process
+        if process is None or process.poll() is not None:
+            return False
+        try:
+            await asyncio.wait_for(entry.browser.version(), timeout=5)
+            return True
+        except Exception:
+            return False
+
+    async def _retire(self, entry, reason):
+        logger.info(f"Recycling pooled browser (pages served: {entry.pages_served}, age: {entry.age:.0f}s, reason: {reason})")
+        _drop_page_metrics(entry.browser)
+        await close_browser(entry.browser, None)
+
+    async def acquire(self):
+        """
+        Leases a browser from the pool, launching one if no healthy warm browser is idle.
+        """
+        self._bind_loop()
+        await self._slots.acquire()
+        try:
+            entry = None
+            while self._idle:
+                candidate = self._idle.pop()
+                if self._expired(candidate):
+                    await self._retire(candidate, 'expired')
+                elif not await self._healthy(candidate):
+                    await self._retire(candidate, 'unhealthy')
+                else:
+                    entry = candidate
+                    logger.info("Reusing warm browser from the pool")
+                    break
+            if entry is None:
+                entry = PooledBrowser(await create_browser())
+        except Exception:
+            self._slots.release()
+            raise
+        self._leased[entry.browser] = entry
+        return entry.browser
+
+    async def release(self, browser, page=None):
+        """
+        Closes the pages opened during the lease and returns the browser to the pool.
+        """
+        entry = self._leased.pop(browser, None)
+        if entry is None:
+            # Not leased from this pool (or leased on a previous loop)
+            await close_browser(browser, page)
+            return
+        try:
+            try:
+                pages = await browser.pages()
+            except Exception as e:
+                logger.error(f"Error listing pages of pooled browser: {e}")
+                pages = [page] if page else []
+            for opened in pages:
+                if opened.url == 'about:blank' and opened is not page:
+                    continue
+                report_page_metrics(opened)
+                try:
+                    await opened.close()
+                    entry.pages_served += 1
+                except Exception as e:
+                    logger.error(f"Error closing page: {e}")
+
+            if self._expired(entry):
+                await self._retire(entry, 'expired')
+            elif not await self._healthy(entry):
+                await self._retire(entry, 'unhealthy')
+            else:
+                self._idle.append(entry)
+        finally:
+            self._slots.release()
+
+    async def discard(self, browser):
+        """
+        Closes a leased browser instead of returning it to the pool, for a
+        browser that is wedged even though it still looks healthy.
+        """
+        entry = self._leased.pop(browser, None)
+        if entry is None:
+            await close_browser(browser, None)
+            return
+        try:
+            await self._retire(entry, 'discarded')
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """
+        Closes every idle browser held by the pool.
+        """
+        while self._idle:
+            await self._retire(self._idle.pop(), 'pool closed')
+
+
+browser_pool = BrowserPool()
+
+async def acquire_browser():
+    return await browser_pool.acquire()
+
+async def release_browser(browser, page=None):
+    await browser_pool.release(browser, page)
+
+async def discard_browser(browser):
+    await browser_pool.discard(browser)
+
+
+_event_loop = None
 
+def run_async(coro):
+    """
+    Runs a coroutine on this process's persistent event loop, so pooled
+    browsers stay usable from one job run to the next.
+    """
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_event_loop)
+    return _event_loop.run_until_complete(coro)
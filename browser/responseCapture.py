@@ -0,0 +1,87 @@
+import asyncio
+import re
+import logging
+
+
+# Setup logging
+logger = logging.getLogger()
+
+# nepalstock.com.np API calls made by its Angular pages
+NEPALSTOCK_API = {
+    'market_open': r'/api/nots/nepse-data/market-open',
+    'live_market': r'/api/nots/lives-market',
+    'floorsheet': r'/api/nots/nepse-data/floorsheet',
+    'disclosure': r'/api/nots/news/companies/disclosure',
+}
+
+
+class ResponseCapture:
+    """
+    Listens to a page's `response` events and keeps the parsed JSON body of
+    every response whose URL matches one of the named API patterns.
+
+    Scrapers read the payloads the page fetched for itself instead of walking
+    the rendered DOM.
+    """
+    def __init__(self, page, names, patterns=NEPALSTOCK_API):
+        self.page = page
+        self.patterns = {name: re.compile(patterns[name]) for name in names}
+        self.payloads = {name: [] for name in names}
+        self.requests = {}
+        self._arrived = {name: asyncio.Event() for name in names}
+        page.on('response', self._on_response)
+
+    def _on_response(self, response):
+        if response.request.method == 'OPTIONS':
+            return
+        for name, pattern in self.patterns.items():
+            if pattern.search(response.url):
+                request = response.request
+                self.requests[name] = {
+                    'url': request.url,
+                    'method': request.method,
+                    'headers': dict(request.headers),
+                    'body': request.postData,
+                }
+                asyncio.ensure_future(self._store(name, response))
+
+    async def _store(self, name, response):
+        if not response.ok:
+            logger.warning(f"Captured {name} response failed with status {response.status}: {response.url}")
+            return
+        try:
+            payload = await response.json()
+        except Exception as e:
+            logger.warning(f"Captured {name} response is not JSON: {e}")
+            return
+        self.payloads[name].append(payload)
+        self._arrived[name].set()
+        logger.info(f"Captured {name} payload from {response.url}")
+
+    def latest(self, name):
+        payloads = self.payloads[name]
+        return payloads[-1] if payloads else None
+
+    def last_request(self, name):
+        """
+        Returns the url, method, headers and body of the last matching request, so it can be replayed.
+        """
+        return self.requests.get(name)
+
+    def clear(self, name):
+        """
+        Forgets payloads captured so far, so the next wait_for() only sees new responses.
+        """
+        self.payloads[name] = []
+        self._arrived[name].clear()
+
+    async def wait_for(self, name, timeout=30):
+        """
+        Waits for a payload matching `name` and returns the latest one, or None on timeout.
+        """
+        try:
+            await asyncio.wait_for(self._arrived[name].wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"No {name} payload captured within {timeout}s")
+            return None
+        return self.latest(name)
@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+import mysql.connector.aio
+from dotenv import load_dotenv
+from db.connectionPool import MYSQL_POOL_SIZE, MYSQL_POOL_TIMEOUT, record_query
+
+
+# Setup logging
+logger = logging.getLogger()
+
+load_dotenv()
+
+# One pool per process and event loop; asyncio primitives cannot cross loops
+_pools = {}
+
+
+class AsyncConnectionPool:
+    """
+    Pool of mysql.connector.aio connections for coroutines.
+
+    Connections are opened on demand up to `size`, health-checked with a ping
+    on checkout, and rolled back before going back to the pool.
+    """
+    def __init__(self, size=MYSQL_POOL_SIZE, timeout=MYSQL_POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = asyncio.LifoQueue()
+        self._opened = 0
+
+    async def _connect(self):
+        return await mysql.connector.aio.connect(
+            host=os.getenv('MYSQL_HOST'),
+            user=os.getenv('MYSQL_USER'),
+            password=os.getenv('MYSQL_PASSWORD'),
+            database=os.getenv('MYSQL_DATABASE'),
+            connection_timeout=int(os.getenv('MYSQL_CONNECTION_TIMEOUT', 10))
+        )
+
+    async def _discard(self, connection):
+        self._opened -= 1
+        try:
+            await connection.close()
+        except Exception as e:
+            logger.debug(f"Error closing async MySQL connection: {e}")
+
+    async def acquire(self):
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                return await self._connect()
+            except Exception:
+                self._opened -= 1
+                raise
+
+        try:
+            connection = await asyncio.wait_for(self._idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise mysql.connector.errors.PoolError(f"No async MySQL connection free within {self.timeout}s")
+
+        # Health check: reconnect if the server dropped the idle connection
+        try:
+            await connection.ping(reconnect=True, attempts=2, delay=1)
+        except mysql.connector.Error:
+            await self._discard(connection)
+            raise
+        return connection
+
+    async def release(self, connection):
+        if connection is None:
+            return
+        try:
+            if connection.in_transaction:
+                await connection.rollback()
+        except Exception as e:
+            logger.error(f"Error resetting async MySQL connection: {e}")
+            await self._discard(connection)
+            return
+        self._idle.put_nowait(connection)
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._discard(self._idle.get_nowait())
+
+
+def get_async_pool():
+    """
+    Returns the async pool for this process and the running event loop.
+    """
+    key = (os.getpid(), asyncio.get_event_loop())
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = AsyncConnectionPool()
+        logger.info(f"Async MySQL pool created with up to {pool.size} connections")
+    return pool
+
+
+@asynccontextmanager
+async def async_connection():
+    """
+    Checks a connection out of the async pool and returns it when the block exits.
+    """
+    pool = get_async_pool()
+    connection = await pool.acquire()
+    try:
+        yield connection
+    finally:
+        await pool.release(connection)
+
+
+class AsyncTimedCursor:
+    """
+    Async cursor wrapper that records latency into the same stats as TimedCursor.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, operation, params=(), *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    async def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+async def async_timed_cursor(connection, **kwargs):
+    return AsyncTimedCursor(await connection.cursor(**kwargs))
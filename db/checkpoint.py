@@ -0,0 +1,63 @@
+import os
+import json
+import logging
+
+
+# Setup logging
+logger = logging.getLogger()
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'state')
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', os.path.join(STATE_DIR, 'checkpoints'))
+
+
+def _path(name):
+    return os.path.join(CHECKPOINT_DIR, f"{name}.json")
+
+
+def load_checkpoint(name, run=None):
+    """
+    Returns the saved progress of crawl `name`, or None if there is none or
+    it belongs to a different `run` (e.g. another trading date).
+    """
+    try:
+        with open(_path(name), 'r') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.error(f"Ignoring unreadable {name} checkpoint: {e}")
+        return None
+    if run is not None and checkpoint.get('run') != run:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(name, checkpoint):
+    """
+    Atomically replaces the saved progress of crawl `name`.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    tmp_path = f"{_path(name)}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, _path(name))
+
+
+def clear_checkpoint(name):
+    try:
+        os.remove(_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def add_resume_arguments(parser):
+    """
+    Adds the --resume / --from-scratch switch shared by the crawl entry points.
+    """
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--resume', dest='resume', action='store_true',
+                       help="continue an interrupted crawl from its checkpoint (default)")
+    group.add_argument('--from-scratch', dest='resume', action='store_false',
+                       help="discard any checkpoint and crawl everything again")
+    parser.set_defaults(resume=True)
+    return parser
@@ -0,0 +1,207 @@
+import os
+import re
+import time
+import threading
+import logging
+from contextlib import contextmanager
+import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from dotenv import load_dotenv
+
+
+# Setup logging
+logger = logging.getLogger()
+
+load_dotenv()
+
+MYSQL_POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', 5))
+MYSQL_POOL_TIMEOUT = int(os.getenv('MYSQL_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+MYSQL_ALLOW_LOCAL_INFILE = os.getenv('MYSQL_ALLOW_LOCAL_INFILE', '0') == '1'  # needed for LOAD DATA LOCAL INFILE
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Statement -> [count, total seconds, max seconds]
+_query_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns this process's connection pool, creating it on first use.
+    A pool inherited from a parent process is never reused.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=f"hamrolagani_{os.getpid()}",
+                pool_size=MYSQL_POOL_SIZE,
+                pool_reset_session=True,
+                host=os.getenv('MYSQL_HOST'),
+                user=os.getenv('MYSQL_USER'),
+                password=os.getenv('MYSQL_PASSWORD'),
+                database=os.getenv('MYSQL_DATABASE'),
+                connection_timeout=int(os.getenv('MYSQL_CONNECTION_TIMEOUT', 10)),
+                allow_local_infile=MYSQL_ALLOW_LOCAL_INFILE
+            )
+            _pool_pid = os.getpid()
+            logger.info(f"MySQL connection pool created with {MYSQL_POOL_SIZE} connections")
+    return _pool
+
+
+def checkout_connection():
+    """
+    Checks a healthy connection out of the pool; close() returns it to the pool.
+    """
+    deadline = time.monotonic() + MYSQL_POOL_TIMEOUT
+    while True:
+        try:
+            connection = get_pool().get_connection()
+            break
+        except PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
+
+    # Health check: reconnect if the server dropped the idle connection
+    try:
+        connection.ping(reconnect=True, attempts=2, delay=1)
+    except mysql.connector.Error:
+        connection.close()
+        raise
+    return connection
+
+
+def release_connection(connection, cursor=None):
+    """
+    Closes the cursor and returns the connection to the pool. Safe to call with None.
+    """
+    if cursor is not None:
+        try:
+            cursor.close()
+        except Exception as e:
+            logger.error(f"Error closing cursor: {e}")
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception as e:
+            logger.error(f"Error returning connection to the pool: {e}")
+
+
+@contextmanager
+def get_connection():
+    """
+    Checks a healthy connection out of the pool and returns it when the block exits.
+    Uncommitted work is rolled back by the pool's session reset.
+    """
+    connection = checkout_connection()
+    try:
+        yield connection
+    finally:
+        release_connection(connection)
+
+
+# Unique indexes of a table whose only column is the given one
+UNIQUE_KEY_SQL = """
+    SELECT COUNT(*) FROM information_schema.STATISTICS s
+    WHERE s.TABLE_SCHEMA = DATABASE() AND s.TABLE_NAME = %s
+      AND s.COLUMN_NAME = %s AND s.NON_UNIQUE = 0 AND s.SEQ_IN_INDEX = 1
+      AND NOT EXISTS (
+          SELECT 1 FROM information_schema.STATISTICS o
+          WHERE o.TABLE_SCHEMA = s.TABLE_SCHEMA AND o.TABLE_NAME = s.TABLE_NAME
+            AND o.INDEX_NAME = s.INDEX_NAME AND o.SEQ_IN_INDEX > 1
+      )
+"""
+
+
+def has_unique_key(table, column):
+    """
+    Returns True if `table` has a unique index on `column` alone, the key an
+    ON DUPLICATE KEY UPDATE on that column relies on.
+    """
+    with get_connection() as connection:
+        cursor = timed_cursor(connection)
+        try:
+            cursor.execute(UNIQUE_KEY_SQL, (table, column))
+            return cursor.fetchone()[0] > 0
+        finally:
+            cursor.close()
+
+
+def _statement_key(operation):
+    return re.sub(r'\s+', ' ', operation).strip()[:80]
+
+
+def record_query(operation, elapsed):
+    """
+    Adds one statement execution to the per-statement latency stats.
+    """
+    key = _statement_key(operation)
+    with _stats_lock:
+        stats = _query_stats.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+
+class TimedCursor:
+    """
+    Cursor wrapper that records the latency of every execute/executemany call.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def timed_cursor(connection, **kwargs):
+    return TimedCursor(connection.cursor(**kwargs))
+
+
+def query_stats():
+    """
+    Returns {statement: {'count', 'avg_ms', 'max_ms', 'total_ms'}} for this process.
+    """
+    with _stats_lock:
+        return {
+            key: {
+                'count': count,
+                'avg_ms': total * 1000 / count,
+                'max_ms': longest * 1000,
+                'total_ms': total * 1000,
+            }
+            for key, (count, total, longest) in _query_stats.items()
+        }
+
+
+def log_query_stats(job_logger=None, reset=True):
+    """
+    Logs the per-statement latency stats collected since the last call.
+    """
+    job_logger = job_logger or logger
+    for key, stats in sorted(query_stats().items(), key=lambda item: -item[1]['total_ms']):
+        job_logger.info(f"DB latency: {stats['count']}x avg {stats['avg_ms']:.1f} ms, max {stats['max_ms']:.1f} ms, total {stats['total_ms']:.0f} ms - {key}")
+    if reset:
+        with _stats_lock:
+            _query_stats.clear()
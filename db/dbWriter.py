@@ -0,0 +1,206 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import logging
+from db.spool import SpoolError, maybe_replay, write_through
+from log import configure_logging
+
+
+# Setup logging
+logger = logging.getLogger()
+
+DB_WRITER_QUEUE_SIZE = int(os.getenv('DB_WRITER_QUEUE_SIZE', 1000))  # submitted batches waiting for the writer
+DB_WRITER_BATCH_ROWS = int(os.getenv('DB_WRITER_BATCH_ROWS', 1000))  # rows per executemany and flush threshold
+DB_WRITER_FLUSH_INTERVAL = float(os.getenv('DB_WRITER_FLUSH_INTERVAL', 2))  # seconds rows may wait before a flush
+DB_WRITER_PUT_TIMEOUT = float(os.getenv('DB_WRITER_PUT_TIMEOUT', 30))  # seconds submit() waits on a full queue
+DB_WRITER_METRICS_INTERVAL = int(os.getenv('DB_WRITER_METRICS_INTERVAL', 60))  # seconds between metrics lines
+
+
+class DBWriter:
+    """
+    Write-behind queue for INSERT/UPSERT statements.
+
+    Scrapers submit rows and carry on; a background thread coalesces them per
+    (table, statement) and writes them with executemany when DB_WRITER_BATCH_ROWS
+    rows are buffered or the oldest row is DB_WRITER_FLUSH_INTERVAL seconds old.
+    A full queue blocks submit() (backpressure); after DB_WRITER_PUT_TIMEOUT the
+    rows are written by the caller instead. Rows MySQL does not accept stay in
+    the local spool (db/spool.py) for replay; rows that could not be spooled
+    either are counted as dropped. Queue depth and flush latency are logged
+    to dbWriter.log.
+    """
+    def __init__(self, queue_size=DB_WRITER_QUEUE_SIZE, batch_rows=DB_WRITER_BATCH_ROWS,
+                 flush_interval=DB_WRITER_FLUSH_INTERVAL):
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics_logger = None
+
+    def _ensure_started(self):
+        # A writer inherited from a parent process has no thread here
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pending_rows = 0
+            self._metrics = {
+                'submitted_rows': 0, 'written_rows': 0, 'spooled_rows': 0, 'dropped_rows': 0, 'flushes': 0,
+                'flush_total_s': 0.0, 'flush_max_s': 0.0, 'flush_last_s': 0.0,
+                'max_depth': 0, 'blocked_submits': 0, 'blocked_s': 0.0, 'inline_writes': 0,
+            }
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def submit(self, table, sql, rows):
+        """
+        Queues `rows` (parameter tuples for `sql`) to be written to `table`.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        self._ensure_started()
+        item = (table, sql, rows)
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            started = time.monotonic()
+            try:
+                self._queue.put(item, timeout=DB_WRITER_PUT_TIMEOUT)
+            except queue.Full:
+                logger.warning(f"DB writer queue full for {DB_WRITER_PUT_TIMEOUT}s, writing {len(rows)} {table} rows inline")
+                with self._metrics_lock:
+                    self._metrics['inline_writes'] += 1
+                self._write(table, sql, rows)
+                return
+            finally:
+                with self._metrics_lock:
+                    self._metrics['blocked_submits'] += 1
+                    self._metrics['blocked_s'] += time.monotonic() - started
+
+        with self._metrics_lock:
+            self._pending_rows += len(rows)
+            self._metrics['submitted_rows'] += len(rows)
+            self._metrics['max_depth'] = max(self._metrics['max_depth'], self._pending_rows)
+
+    def flush(self):
+        """
+        Blocks until every row submitted so far has been written (or failed).
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            self.log_metrics()
+
+    def _run(self):
+        buffers = {}
+        buffered_rows = 0
+        buffered_items = 0
+        first_buffered = None
+        last_metrics = time.monotonic()
+
+        while True:
+            timeout = self.flush_interval if first_buffered is None else max(first_buffered + self.flush_interval - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+                maybe_replay()
+
+            stop = item is None
+            if item:
+                table, sql, rows = item
+                buffers.setdefault((table, sql), []).extend(rows)
+                buffered_rows += len(rows)
+                buffered_items += 1
+                if first_buffered is None:
+                    first_buffered = time.monotonic()
+
+            due = first_buffered is not None and time.monotonic() - first_buffered >= self.flush_interval
+            if buffered_rows and (stop or due or buffered_rows >= self.batch_rows):
+                self._flush(buffers)
+                with self._metrics_lock:
+                    self._pending_rows -= buffered_rows
+                for _ in range(buffered_items):
+                    self._queue.task_done()
+                buffers = {}
+                buffered_rows = 0
+                buffered_items = 0
+                first_buffered = None
+
+            if time.monotonic() - last_metrics >= DB_WRITER_METRICS_INTERVAL:
+                self.log_metrics()
+                last_metrics = time.monotonic()
+
+            if stop:
+                self._queue.task_done()
+                break
+
+    def _flush(self, buffers):
+        started = time.monotonic()
+        for (table, sql), rows in buffers.items():
+            self._write(table, sql, rows)
+        elapsed = time.monotonic() - started
+        with self._metrics_lock:
+            self._metrics['flushes'] += 1
+            self._metrics['flush_total_s'] += elapsed
+            self._metrics['flush_last_s'] = elapsed
+            self._metrics['flush_max_s'] = max(self._metrics['flush_max_s'], elapsed)
+
+    def _write(self, table, sql, rows):
+        # Rows land in the local spool first and stay there if MySQL is unavailable
+        try:
+            written = write_through(table, sql, rows, self.batch_rows)
+        except SpoolError:
+            with self._metrics_lock:
+                self._metrics['dropped_rows'] += len(rows)
+            return
+        if written:
+            with self._metrics_lock:
+                self._metrics['written_rows'] += len(rows)
+        else:
+            with self._metrics_lock:
+                self._metrics['spooled_rows'] += len(rows)
+
+    def metrics(self):
+        """
+        Returns this process's writer metrics, including the current queue depth in rows.
+        """
+        if self._pid != os.getpid():
+            return {}
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+            metrics['depth'] = self._pending_rows
+        metrics['flush_avg_s'] = metrics['flush_total_s'] / metrics['flushes'] if metrics['flushes'] else 0.0
+        return metrics
+
+    def log_metrics(self, job_logger=None):
+        metrics = self.metrics()
+        if not metrics:
+            return
+        if job_logger is None:
+            if self._metrics_logger is None:
+                self._metrics_logger, _ = configure_logging("dbWriter.log", "db_writer")
+            job_logger = self._metrics_logger
+        job_logger.info(
+            f"[pid {os.getpid()}] depth {metrics['depth']} rows (max {metrics['max_depth']}), "
+            f"written {metrics['written_rows']}, spooled {metrics['spooled_rows']}, dropped {metrics['dropped_rows']}, "
+            f"flushes {metrics['flushes']} (avg {metrics['flush_avg_s'] * 1000:.0f} ms, "
+            f"max {metrics['flush_max_s'] * 1000:.0f} ms, last {metrics['flush_last_s'] * 1000:.0f} ms), "
+            f"blocked submits {metrics['blocked_submits']} ({metrics['blocked_s']:.1f}s), inline writes {metrics['inline_writes']}"
+        )
+
+
+db_writer = DBWriter()
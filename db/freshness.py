@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'state')
+FRESHNESS_PATH = os.getenv('FRESHNESS_PATH', os.path.join(STATE_DIR, 'freshness.sqlite3'))
+
+
+def _connect():
+    os.makedirs(os.path.dirname(FRESHNESS_PATH), exist_ok=True)
+    connection = sqlite3.connect(FRESHNESS_PATH, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS freshness (
+            job TEXT NOT NULL,
+            item TEXT NOT NULL,
+            crawled_at REAL NOT NULL,
+            content_hash TEXT NOT NULL,
+            changed_at REAL NOT NULL,
+            PRIMARY KEY (job, item)
+        )
+    """)
+    return connection
+
+
+def content_hash(rows):
+    """
+    Stable hash of scraped rows, independent of dictionary key order.
+    """
+    return hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def crawl_times(job):
+    """
+    Returns {item: last crawl time} for every item `job` has recorded.
+    """
+    connection = _connect()
+    try:
+        return dict(connection.execute("SELECT item, crawled_at FROM freshness WHERE job = ?", (job,)).fetchall())
+    finally:
+        connection.close()
+
+
+def stored_hash(job, item):
+    connection = _connect()
+    try:
+        row = connection.execute(
+            "SELECT content_hash FROM freshness WHERE job = ? AND item = ?", (job, item)
+        ).fetchone()
+    finally:
+        connection.close()
+    return row[0] if row else None
+
+
+def record_crawl(job, item, digest):
+    """
+    Marks `item` as crawled now with content `digest`. Returns True if the
+    content differs from the previous crawl.
+    """
+    now = time.time()
+    connection = _connect()
+    try:
+        with connection:
+            row = connection.execute(
+                "SELECT content_hash FROM freshness WHERE job = ? AND item = ?", (job, item)
+            ).fetchone()
+            changed = row is None or row[0] != digest
+            connection.execute("""
+                INSERT INTO freshness (job, item, crawled_at, content_hash, changed_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (job, item) DO UPDATE SET
+                    crawled_at = excluded.crawled_at,
+                    content_hash = excluded.content_hash,
+                    changed_at = CASE WHEN freshness.content_hash = excluded.content_hash
+                                      THEN freshness.changed_at ELSE excluded.changed_at END
+            """, (job, item, now, digest, now))
+    finally:
+        connection.close()
+    return changed
+
+
+def prune(job, max_age):
+    """
+    Forgets items of `job` not crawled for `max_age` seconds.
+    """
+    connection = _connect()
+    try:
+        with connection:
+            connection.execute("DELETE FROM freshness WHERE job = ? AND crawled_at < ?", (job, time.time() - max_age))
+    finally:
+        connection.close()
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+import mysql.connector
+from db.connectionPool import checkout_connection, release_connection, timed_cursor
+
+
+# Setup logging
+logger = logging.getLogger()
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'state')
+SPOOL_PATH = os.getenv('DB_SPOOL_PATH', os.path.join(STATE_DIR, 'spool.sqlite3'))
+SPOOL_REPLAY_INTERVAL = int(os.getenv('DB_SPOOL_REPLAY_INTERVAL', 30))  # seconds between replay attempts
+SPOOL_REPLAY_MIN_AGE = int(os.getenv('DB_SPOOL_REPLAY_MIN_AGE', 60))  # seconds before another writer's entry is replayed
+SPOOL_REPLAY_BATCH = int(os.getenv('DB_SPOOL_REPLAY_BATCH', 50))  # spooled batches per replay pass
+SPOOL_MARKER_DAYS = int(os.getenv('DB_SPOOL_MARKER_DAYS', 7))  # days applied batch keys are kept in MySQL
+SPOOL_MAX_ATTEMPTS = int(os.getenv('DB_SPOOL_MAX_ATTEMPTS', 5))  # rejections before a batch moves to the dead letters
+
+# One row per batch written through MySQL, committed in the same transaction as
+# the batch itself, so a batch is never applied twice
+CREATE_MARKERS_SQL = """
+    CREATE TABLE IF NOT EXISTS spool_applied (
+        spool_key CHAR(32) NOT NULL PRIMARY KEY,
+        table_name VARCHAR(64) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+"""
+
+_markers_ready = False
+_replay_lock = threading.Lock()
+_last_replay = 0
+
+
+class SpoolError(Exception):
+    """
+    Rows could neither be spooled locally nor written to MySQL, so they are lost.
+    """
+
+
+def _connect():
+    os.makedirs(os.path.dirname(SPOOL_PATH), exist_ok=True)
+    connection = sqlite3.connect(SPOOL_PATH, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS spool (
+            spool_key TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            statement TEXT NOT NULL,
+            rows TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Batches MySQL kept rejecting; kept for inspection, never replayed
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS spool_dead (
+            spool_key TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            statement TEXT NOT NULL,
+            rows TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL,
+            error TEXT,
+            failed_at REAL NOT NULL
+        )
+    """)
+    # Spools created before the attempts column existed
+    columns = [column[1] for column in connection.execute("PRAGMA table_info(spool)")]
+    if 'attempts' not in columns:
+        connection.execute("ALTER TABLE spool ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    return connection
+
+
+def append(table, sql, rows):
+    """
+    Durably records a batch before it is sent to MySQL. Returns its key.
+    """
+    key = uuid.uuid4().hex
+    connection = _connect()
+    try:
+        with connection:
+            connection.execute(
+                "INSERT INTO spool (spool_key, table_name, statement, rows, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, table, sql, json.dumps(rows, default=str), time.time())
+            )
+    finally:
+        connection.close()
+    return key
+
+
+def remove(key):
+    connection = _connect()
+    try:
+        with connection:
+            connection.execute("DELETE FROM spool WHERE spool_key = ?", (key,))
+    finally:
+        connection.close()
+
+
+def reject(key, error, max_attempts=SPOOL_MAX_ATTEMPTS):
+    """
+    Counts a rejection of a spooled batch; after `max_attempts` it moves to
+    the spool_dead table. Returns True if the batch was moved.
+    """
+    connection = _connect()
+    try:
+        with connection:
+            connection.execute("UPDATE spool SET attempts = attempts + 1 WHERE spool_key = ?", (key,))
+            moved = connection.execute("""
+                INSERT INTO spool_dead (spool_key, table_name, statement, rows, created_at, attempts, error, failed_at)
+                SELECT spool_key, table_name, statement, rows, created_at, attempts, ?, ?
+                FROM spool WHERE spool_key = ? AND attempts >= ?
+            """, (str(error), time.time(), key, max_attempts)).rowcount
+            if moved:
+                connection.execute("DELETE FROM spool WHERE spool_key = ?", (key,))
+    finally:
+        connection.close()
+    return bool(moved)
+
+
+def dead_count():
+    connection = _connect()
+    try:
+        return connection.execute("SELECT COUNT(*) FROM spool_dead").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def pending(limit=SPOOL_REPLAY_BATCH, min_age=SPOOL_REPLAY_MIN_AGE, table=None):
+    """
+    Returns up to `limit` spooled batches older than `min_age` seconds, oldest
+    first, optionally only those of `table`.
+    """
+    connection = _connect()
+    try:
+        entries = connection.execute(
+            "SELECT spool_key, table_name, statement, rows FROM spool "
+            "WHERE created_at <= ? AND (? IS NULL OR table_name = ?) ORDER BY created_at LIMIT ?",
+            (time.time() - min_age, table, table, limit)
+        ).fetchall()
+    finally:
+        connection.close()
+    return [(key, table, sql, json.loads(rows)) for key, table, sql, rows in entries]
+
+
+def pending_count(table=None):
+    connection = _connect()
+    try:
+        return connection.execute(
+            "SELECT COUNT(*) FROM spool WHERE ? IS NULL OR table_name = ?", (table, table)
+        ).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def _ensure_markers(cursor):
+    global _markers_ready
+    if not _markers_ready:
+        cursor.execute(CREATE_MARKERS_SQL)
+        _markers_ready = True
+
+
+def apply(connection, cursor, key, table, sql, rows, batch_rows=1000):
+    """
+    Writes a spooled batch and its marker in one transaction. Returns False if
+    the batch had already been applied.
+    """
+    _ensure_markers(cursor)
+    try:
+        cursor.execute(
+            "INSERT INTO spool_applied (spool_key, table_name, applied_at) VALUES (%s, %s, NOW())",
+            (key, table)
+        )
+    except mysql.connector.IntegrityError:
+        connection.rollback()
+        return False
+    for start in range(0, len(rows), batch_rows):
+        cursor.executemany(sql, [tuple(row) for row in rows[start:start + batch_rows]])
+    connection.commit()
+    return True
+
+
+def write_through(table, sql, rows, batch_rows=1000):
+    """
+    Spools `rows`, writes them to MySQL and drops them from the spool once
+    committed. Returns True if they reached MySQL; otherwise they stay
+    spooled for replay_spool(). Raises SpoolError if the spool was not
+    writable and MySQL failed too.
+
+    Older spooled batches of `table` are replayed first, since replaying them
+    later would overwrite these rows with older values. While any are still
+    pending, `rows` are queued behind them in the spool instead.
+    """
+    held = False
+    try:
+        if pending_count(table):
+            replay_spool(min_age=0, table=table)
+            held = pending_count(table) > 0
+    except Exception as e:
+        logger.error(f"Could not replay spooled {table} batches before writing: {e}")
+
+    spooled = True
+    try:
+        key = append(table, sql, rows)
+    except Exception as e:
+        logger.error(f"Could not spool {len(rows)} {table} rows, writing without a spool: {e}")
+        key = uuid.uuid4().hex
+        spooled = False
+
+    if held and spooled:
+        logger.warning(f"Kept {len(rows)} {table} rows in the local spool behind older {table} batches still pending")
+        return False
+
+    connection = None
+    cursor = None
+    try:
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        apply(connection, cursor, key, table, sql, rows, batch_rows)
+    except Exception as e:
+        if not spooled:
+            logger.error(f"Dropped {len(rows)} {table} rows: not spooled and the MySQL write failed: {e}")
+            raise SpoolError(f"{len(rows)} {table} rows dropped: {e}") from e
+        logger.warning(f"Kept {len(rows)} {table} rows in the local spool, MySQL write failed: {e}")
+        return False
+    finally:
+        release_connection(connection, cursor)
+
+    if spooled:
+        try:
+            remove(key)
+        except Exception as e:
+            logger.error(f"Could not drop applied batch {key} from the spool: {e}")
+
+    maybe_replay()
+    return True
+
+
+def replay_spool(job_logger=None, limit=SPOOL_REPLAY_BATCH, min_age=SPOOL_REPLAY_MIN_AGE, table=None):
+    """
+    Bulk-loads spooled batches (of `table`, or all) into MySQL, oldest first,
+    stopping at the first connection failure. Batches already applied are
+    only dropped from the spool; batches MySQL rejects SPOOL_MAX_ATTEMPTS
+    times move to spool_dead, and until then hold back the newer batches of
+    their table.
+    Returns the number of batches written.
+    """
+    job_logger = job_logger or logger
+    entries = pending(limit, min_age, table)
+    if not entries:
+        return 0
+
+    written = 0
+    blocked = set()
+    connection = None
+    cursor = None
+    try:
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        for key, table, sql, rows in entries:
+            # Newer batches of a table wait until its rejected batch goes through or is dropped
+            if table in blocked:
+                continue
+            try:
+                if apply(connection, cursor, key, table, sql, rows):
+                    written += 1
+            except (mysql.connector.InterfaceError, mysql.connector.OperationalError):
+                raise
+            except mysql.connector.Error as e:
+                # Rejected by MySQL itself; retry on later passes, then give up on it
+                connection.rollback()
+                if reject(key, e):
+                    job_logger.error(f"Spooled {table} batch {key} rejected {SPOOL_MAX_ATTEMPTS} times, moved to spool_dead: {e}")
+                else:
+                    job_logger.error(f"Spooled {table} batch {key} was rejected: {e}")
+                    blocked.add(table)
+                continue
+            remove(key)
+        cursor.execute(
+            "DELETE FROM spool_applied WHERE applied_at < NOW() - INTERVAL %s DAY",
+            (SPOOL_MARKER_DAYS,)
+        )
+        connection.commit()
+    except Exception as e:
+        job_logger.warning(f"Spool replay stopped after {written} batches: {e}")
+    finally:
+        release_connection(connection, cursor)
+
+    job_logger.info(f"Replayed {written} of {len(entries)} spooled batches into MySQL ({dead_count()} in spool_dead)")
+    return written
+
+
+def maybe_replay():
+    """
+    Runs replay_spool() at most once per SPOOL_REPLAY_INTERVAL seconds per process.
+    """
+    global _last_replay
+    if time.monotonic() - _last_replay < SPOOL_REPLAY_INTERVAL or not _replay_lock.acquire(blocking=False):
+        return
+    try:
+        _last_replay = time.monotonic()
+        if pending_count():
+            replay_spool()
+    except Exception as e:
+        logger.error(f"Spool replay failed: {e}")
+    finally:
+        _replay_lock.release()
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+import logging
+from db.connectionPool import checkout_connection, release_connection, timed_cursor
+
+
+# Setup logging
+logger = logging.getLogger()
+
+STOCK_REGISTRY_TTL = int(os.getenv('STOCK_REGISTRY_TTL', 3600))  # seconds
+STOCK_REGISTRY_MISS_INTERVAL = int(os.getenv('STOCK_REGISTRY_MISS_INTERVAL', 60))  # seconds between refreshes on a miss
+
+
+class StockRegistry:
+    """
+    Process-wide cache of stock symbol -> stock id and sector name -> sector id.
+
+    Loaded on first use, reloaded when older than `ttl` seconds, and reloaded
+    on an unknown symbol at most once every `miss_interval` seconds.
+    """
+    def __init__(self, ttl=STOCK_REGISTRY_TTL, miss_interval=STOCK_REGISTRY_MISS_INTERVAL):
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self._stocks = {}
+        self._sectors = {}
+        self._loaded_at = None
+        self._miss_refreshed_at = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        connection = None
+        cursor = None
+        try:
+            connection = checkout_connection()
+            cursor = timed_cursor(connection)
+            cursor.execute("SELECT id, symbol FROM stock")
+            stocks = {symbol: stock_id for stock_id, symbol in cursor.fetchall()}
+            cursor.execute("SELECT id, index_display_name FROM sector")
+            sectors = {index_name: index_id for index_id, index_name in cursor.fetchall()}
+        finally:
+            release_connection(connection, cursor)
+
+        with self._lock:
+            self._stocks = stocks
+            self._sectors = sectors
+            self._loaded_at = time.monotonic()
+        logger.info(f"Stock registry loaded {len(stocks)} stocks and {len(sectors)} sectors")
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self.refresh()
+
+    def _refresh_on_miss(self):
+        now = time.monotonic()
+        if now - self._miss_refreshed_at < self.miss_interval:
+            return False
+        self._miss_refreshed_at = now
+        self.refresh()
+        return True
+
+    def stock_id(self, symbol):
+        self._ensure_fresh()
+        stock_id = self._stocks.get(symbol)
+        if stock_id is None and self._refresh_on_miss():
+            stock_id = self._stocks.get(symbol)
+        return stock_id
+
+    def sector_id(self, index_name):
+        self._ensure_fresh()
+        sector_id = self._sectors.get(index_name)
+        if sector_id is None and self._refresh_on_miss():
+            sector_id = self._sectors.get(index_name)
+        return sector_id
+
+    def symbols(self):
+        self._ensure_fresh()
+        return list(self._stocks)
+
+
+stock_registry = StockRegistry()
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import logging
+from html.parser import HTMLParser
+import aiohttp
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
+from browser.tableExtractor import normalise_header
+
+
+# Setup logging
+logger = logging.getLogger()
+
+DIVIDEND_URL = 'https://merolagani.com/CompanyDetail.aspx?symbol={symbol}'
+DIVIDEND_TAB_TARGET = 'ctl00$ContentPlaceHolder1$CompanyDetail1$lnkDividendTab'
+DIVIDEND_DIV_ID = 'ctl00_ContentPlaceHolder1_CompanyDetail1_divDividendData'
+DIVIDEND_MAX_PAGES = int(os.getenv('DIVIDEND_MAX_PAGES', 50))
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+}
+
+# javascript:__doPostBack('target','argument')
+DO_POSTBACK = re.compile(r"__doPostBack\('([^']*)','([^']*)'\)")
+# changePageIndex('2','hiddenFieldId','buttonId') sets the page field and clicks a hidden button
+CHANGE_PAGE_INDEX = re.compile(r"changePageIndex\('([^']*)'\s*,\s*'([^']*)'\s*,\s*'([^']*)'\)")
+
+
+class PostbackError(Exception):
+    """
+    The page did not have the form or dividend section the fetcher expects.
+    """
+
+
+class AspNetForm(HTMLParser):
+    """
+    Collects the values a browser would post back: inputs, checked boxes,
+    selected options and textareas, plus submit buttons and element id -> name.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.fields = {}
+        self.buttons = {}
+        self.names = {}
+        self._select = None
+        self._textarea = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        name = attrs.get('name')
+        if name and attrs.get('id'):
+            self.names[attrs['id']] = name
+
+        if tag == 'input' and name:
+            kind = (attrs.get('type') or 'text').lower()
+            if kind in ('submit', 'button', 'image'):
+                self.buttons[name] = attrs.get('value', '')
+            elif kind in ('checkbox', 'radio'):
+                if 'checked' in attrs:
+                    self.fields[name] = attrs.get('value', 'on')
+            else:
+                self.fields[name] = attrs.get('value') or ''
+        elif tag == 'select' and name:
+            self._select = name
+            self.fields.setdefault(name, '')
+        elif tag == 'option' and self._select and 'selected' in attrs:
+            self.fields[self._select] = attrs.get('value', '')
+        elif tag == 'textarea' and name:
+            self._textarea = name
+            self.fields[name] = ''
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+        elif tag == 'textarea':
+            self._textarea = None
+
+    def handle_data(self, data):
+        if self._textarea:
+            self.fields[self._textarea] += data
+
+
+class DividendSection(HTMLParser):
+    """
+    Reads the table rows and the "Next Page" link inside the dividend section.
+    Each row is a list of (tag, text) cells.
+    """
+    def __init__(self, div_id=DIVIDEND_DIV_ID):
+        super().__init__(convert_charrefs=True)
+        self.div_id = div_id
+        self.found = False
+        self.rows = []
+        self.next_link = None
+        self._depth = 0
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if not self._depth:
+            if tag == 'div' and attrs.get('id') == self.div_id:
+                self.found = True
+                self._depth = 1
+            return
+
+        if tag == 'div':
+            self._depth += 1
+        elif tag == 'tr':
+            self._row = []
+        elif tag in ('th', 'td') and self._row is not None:
+            self._cell = [tag, '']
+        elif tag == 'a' and 'next page' in (attrs.get('title') or '').lower():
+            self.next_link = (attrs.get('onclick') or '') + ' ' + (attrs.get('href') or '')
+
+    def handle_endtag(self, tag):
+        if not self._depth:
+            return
+        if tag == 'div':
+            self._depth -= 1
+        elif tag in ('th', 'td') and self._cell is not None:
+            self._row.append((self._cell[0], self._cell[1].strip()))
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._depth and self._cell is not None:
+            self._cell[1] += data
+
+
+def parse_dividend_section(page_html):
+    """
+    Returns (headers, rows, next_link) of the dividend table, skipping the
+    first (serial number) column like the browser scraper.
+    """
+    section = DividendSection()
+    section.feed(page_html)
+    if not section.found:
+        raise PostbackError("dividend section not found in the response")
+
+    headers = []
+    rows = []
+    for cells in section.rows:
+        if cells and all(tag == 'th' for tag, _ in cells):
+            if not headers:
+                headers = [normalise_header(text) for _, text in cells[1:]]
+        elif cells:
+            rows.append([text for _, text in cells[1:]])
+    return headers, rows, section.next_link
+
+
+def postback_fields(page_html, link):
+    """
+    Builds the form data for following `link`, a __doPostBack or changePageIndex call.
+    """
+    form = AspNetForm()
+    form.feed(page_html)
+    if '__VIEWSTATE' not in form.fields:
+        raise PostbackError("ASP.NET form state not found in the response")
+
+    fields = dict(form.fields)
+    fields['__EVENTTARGET'] = ''
+    fields['__EVENTARGUMENT'] = ''
+
+    postback = DO_POSTBACK.search(link)
+    change_page = CHANGE_PAGE_INDEX.search(link)
+    if postback:
+        fields['__EVENTTARGET'], fields['__EVENTARGUMENT'] = postback.groups()
+    elif change_page:
+        page_number, field_id, button_id = change_page.groups()
+        field_name = form.names.get(field_id)
+        button_name = form.names.get(button_id)
+        if not field_name or not button_name:
+            raise PostbackError(f"paging controls {field_id}/{button_id} not found")
+        fields[field_name] = page_number
+        fields[button_name] = form.buttons.get(button_name, '')
+    else:
+        raise PostbackError(f"unrecognised postback link: {link.strip()}")
+    return fields
+
+
+async def _post(session, url, fields):
+    async with session.post(url, data=fields, headers={**HEADERS, 'Referer': url}) as response:
+        response.raise_for_status()
+        return await response.text()
+
+
+async def fetch_dividend_rows(session, symbol):
+    """
+    Fetches every dividend page of `symbol` by replaying the page's postbacks.
+    Returns rows as dictionaries keyed like the browser scraper's, starting with the symbol.
+    """
+    url = DIVIDEND_URL.format(symbol=symbol)
+    async with session.get(url, headers=HEADERS) as response:
+        response.raise_for_status()
+        page_html = await response.text()
+
+    # Open the dividend tab
+    page_html = await _post(session, url, postback_fields(page_html, f"__doPostBack('{DIVIDEND_TAB_TARGET}','')"))
+    headers, rows, next_link = parse_dividend_section(page_html)
+    if not headers:
+        logger.info(f"No dividend table for {symbol}")
+        return []
+
+    all_rows = list(rows)
+    page_number = 1
+    while next_link and rows and page_number < DIVIDEND_MAX_PAGES:
+        page_html = await _post(session, url, postback_fields(page_html, next_link))
+        _, next_rows, next_link = parse_dividend_section(page_html)
+        if next_rows == rows:
+            break
+        rows = next_rows
+        all_rows.extend(rows)
+        page_number += 1
+
+    logger.info(f"Fetched {len(all_rows)} dividend rows over {page_number} pages for {symbol}")
+    header = ['symbol'] + headers
+    return [dict(zip(header, [symbol] + row)) for row in all_rows]
+
+
+def dividend_session(concurrency):
+    """
+    HTTP session for the postback fetcher with at most `concurrency` open connections.
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60))
@@ -4,12 +4,15 @@ import os
 import sys
 import time
 import mysql.connector
-from mysql.connector import errorcode
 from dotenv import load_dotenv
 import asyncio
 from pyppeteer import launch
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import acquire_browser, new_page, release_browser, run_async
+from db.connectionPool import checkout_connection, has_unique_key, log_query_stats, release_connection, timed_cursor
+from db.spool import SpoolError, write_through
+from db.stockRegistry import stock_registry
+from browser.tableExtractor import extract_table
 import schedule
 
 
@@ -34,8 +37,8 @@ url = 'https://chukul.com/stock-filter'
 async def scrape_data():
     logger.info("Starting the web scraping process...")
     # Set up Puppeteer
-    browser = await create_browser()
-    page = await browser.newPage()
+    browser = await acquire_browser()
+    page = await new_page(browser, url, logger)
     await page.goto(url)
     logger.info("Opened the URL in the browser.")
 
@@ -63,32 +66,22 @@ async def scrape_data():
         await dropdown_values[-1].click()
         logger.info("Selected the last item in the dropdown.")
 
-        # Extract data from the table
-        rows = await page.querySelectorAll('table tbody tr')
-        extracted_data = []
-        for row in rows:
-            cells = await row.querySelectorAll('td')
-            row_data = []
-            for cell in cells:
-                cell_text = await page.evaluate('(element) => element.textContent', cell)
-                row_data.append(cell_text)
-            extracted_data.append(row_data)
+        # Extract headers and data from the table
+        extracted_header, extracted_data = await extract_table(
+            page,
+            row_xpath='//table/tbody/tr',
+            header_xpath='//table/thead/tr/th',
+            header_replacements=[('arrow_upward', '')],
+            text_property='textContent'
+        )
         logger.info("Extracted data from the table.")
-
-        # Extract headers from the table
-        headers = await page.querySelectorAll('table thead tr th')
-        extracted_header = []
-        for header in headers:
-            header_text = await page.evaluate('(element) => element.textContent', header)
-            header_text = header_text.replace('arrow_upward', "")
-            extracted_header.append(header_text)
     finally:
         # Close the browser
-        await close_browser(browser, page)
+        await release_browser(browser, page)
         logger.info("Closed the browser.")
 
     # Filter data
-    filtering_columns = ["Symbol", "EPS", "P/E Ratio"]
+    filtering_columns = ["symbol", "eps", "p/e_ratio"]
     filtering_indices = [extracted_header.index(col) for col in filtering_columns]
 
     final_data = []
@@ -98,81 +91,132 @@ async def scrape_data():
 
     return final_data
 
-def insert_data_into_database(final_data):
-    # Connect to the database
+# Cell texts stored as 0.00
+MISSING_VALUES = {'', 'NaN', 'nan', '-', 'N/A'}
+
+# Needs a unique key on stock_eps_pe.stock_id (see eps_upsert_supported)
+UPSERT_EPS_SQL = """
+    INSERT INTO stock_eps_pe (stock_id, EPS, PE_Ratio, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        EPS = VALUES(EPS),
+        PE_Ratio = VALUES(PE_Ratio),
+        updated_at = VALUES(updated_at)
+"""
+
+
+ADD_EPS_KEY_SQL = "ALTER TABLE stock_eps_pe ADD UNIQUE KEY stock_eps_pe_stock_id_unique (stock_id)"
+
+_eps_upsert_supported = None
+
+
+def eps_upsert_supported():
+    """
+    Checks once per process that stock_eps_pe has the unique key on stock_id
+    UPSERT_EPS_SQL relies on; without it ON DUPLICATE KEY never fires.
+    """
+    global _eps_upsert_supported
+    if _eps_upsert_supported is None:
+        _eps_upsert_supported = has_unique_key('stock_eps_pe', 'stock_id')
+        if not _eps_upsert_supported:
+            logger.warning(f"stock_eps_pe has no unique key on stock_id, using update/insert instead of the upsert. "
+                           f"Add it with: {ADD_EPS_KEY_SQL}")
+    return _eps_upsert_supported
+
+
+def update_or_insert_eps(values):
+    """
+    Fallback without the unique key: updates the stock_ids already present and
+    inserts the rest, in one transaction. Returns True once committed.
+    """
+    connection = None
+    cursor = None
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE')
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        stock_ids = [row[0] for row in values]
+        cursor.execute(
+            f"SELECT DISTINCT stock_id FROM stock_eps_pe WHERE stock_id IN ({', '.join(['%s'] * len(stock_ids))})",
+            stock_ids
         )
-        logger.info("Connection established.")
-        cursor = connection.cursor()
-
-        # Retrieve stock symbols and their IDs
-        cursor.execute("SELECT id, symbol FROM stock")
-        symbols = cursor.fetchall()
-        logger.info("Fetched stock symbols and IDs from the database.")
-
-        symbol_dict = {symbol: stock_id for stock_id, symbol in symbols}
-
-        # Insert or update data into the database
-        for row in final_data:
-            symbol = row[0].strip()
-            eps = row[1]
-            pe_ratio = row[2]
-
-            # Handle NaN values
-            eps = '0.00' if eps == 'NaN' or eps == '' else eps
-            pe_ratio = '0.00' if pe_ratio == 'NaN' or pe_ratio == '' else pe_ratio
-
-            current_date = datetime.now()
-
-            stock_id = symbol_dict.get(symbol)
-            if stock_id is not None:
-                # Check if the stock_id already exists in stock_eps_pe
-                cursor.execute("SELECT stock_id FROM stock_eps_pe WHERE stock_id = %s", (stock_id,))
-                result = cursor.fetchone()
-                
-                if result:
-                    # If the stock_id exists, update the record
-                    sql_update = """
-                        UPDATE stock_eps_pe
-                        SET EPS = %s, PE_Ratio = %s, updated_at = %s
-                        WHERE stock_id = %s
-                    """
-                    cursor.execute(sql_update, (eps, pe_ratio, current_date, stock_id))
-                else:
-                    # If the stock_id does not exist, insert a new record
-                    sql_insert = """
-                        INSERT INTO stock_eps_pe (stock_id, EPS, PE_Ratio, created_at, updated_at)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """
-                    cursor.execute(sql_insert, (stock_id, eps, pe_ratio, current_date, current_date))
-        logger.info("Data Inserted/Updated for EPS and PERatio")
-        # Commit the transaction
+        existing = {stock_id for stock_id, in cursor.fetchall()}
+
+        updates = [(eps, pe_ratio, updated_at, stock_id)
+                   for stock_id, eps, pe_ratio, _, updated_at in values if stock_id in existing]
+        inserts = [row for row in values if row[0] not in existing]
+        if updates:
+            cursor.executemany("UPDATE stock_eps_pe SET EPS = %s, PE_Ratio = %s, updated_at = %s WHERE stock_id = %s", updates)
+        if inserts:
+            cursor.executemany(
+                "INSERT INTO stock_eps_pe (stock_id, EPS, PE_Ratio, created_at, updated_at) VALUES (%s, %s, %s, %s, %s)",
+                inserts
+            )
         connection.commit()
-        logger.info("Data committed to the database.")
-
+        return True
     except mysql.connector.Error as err:
-        logger.error(f"Error: {err}")
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            logger.error("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            logger.error("Database does not exist")
-        else:
-            logger.error(err)
+        logger.error(f"EPS and PERatio update/insert failed: {err}")
+        return False
     finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-            logger.info("Closed the database connection.")
+        release_connection(connection, cursor)
+
+
+def normalise_eps_rows(final_data):
+    """
+    Cleans all (symbol, eps, pe_ratio) rows in one pass: strips whitespace and
+    thousands separators and maps missing values to '0.00'.
+    """
+    columns = list(zip(*final_data)) or [(), (), ()]
+    symbols = [symbol.strip() for symbol in columns[0]]
+    eps, pe_ratio = (
+        ['0.00' if value in MISSING_VALUES else value for value in (cell.strip().replace(',', '') for cell in column)]
+        for column in columns[1:3]
+    )
+    return list(zip(symbols, eps, pe_ratio))
+
+
+def insert_data_into_database(final_data):
+    """
+    Upserts every symbol's EPS and P/E ratio in one batched statement.
+    """
+    current_date = datetime.now()
+
+    values = {}
+    unmapped_symbols = []
+    for symbol, eps, pe_ratio in normalise_eps_rows(final_data):
+        stock_id = stock_registry.stock_id(symbol)
+        if stock_id is None:
+            unmapped_symbols.append(symbol)
+            continue
+        values[stock_id] = (stock_id, eps, pe_ratio, current_date, current_date)
+
+    if unmapped_symbols:
+        logger.warning(f"No matching stock_id found for {len(unmapped_symbols)} symbols: {', '.join(sorted(set(unmapped_symbols)))}")
+
+    if not values:
+        return
+    try:
+        if not eps_upsert_supported():
+            # Not spooled: a replayed insert could duplicate rows added since
+            if update_or_insert_eps(list(values.values())):
+                logger.info(f"Data Inserted/Updated for EPS and PERatio: {len(values)} rows committed to the database.")
+            return
+    except mysql.connector.Error as err:
+        logger.error(f"Could not check the stock_eps_pe unique key: {err}")
+        return
+    try:
+        written = write_through('stock_eps_pe', UPSERT_EPS_SQL, list(values.values()))
+    except SpoolError as e:
+        logger.error(f"EPS and PERatio upsert failed and the rows could not be spooled: {e}")
+        return
+    if written:
+        logger.info(f"Data Inserted/Updated for EPS and PERatio: {len(values)} rows committed to the database.")
+    else:
+        logger.error(f"EPS and PERatio upsert of {len(values)} rows failed; rows kept in the local spool.")
 
 def job():
-    loop = asyncio.get_event_loop()
-    data = loop.run_until_complete(scrape_data())
+    data = run_async(scrape_data())
     insert_data_into_database(data)
+    log_query_stats(logger)
 
 
 def eps():
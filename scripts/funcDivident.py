@@ -1,3 +1,4 @@
+import argparse
 from datetime import datetime
 import os
 import sys
@@ -9,10 +10,16 @@ from dotenv import load_dotenv
 import asyncio
 import os
 import schedule
-from concurrent.futures import ProcessPoolExecutor
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from browser.broswerFunc import close_browser, create_browser
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
+from browser.broswerFunc import acquire_browser, discard_browser, new_page, release_browser, report_page_metrics, run_async
+from db.connectionPool import checkout_connection, log_query_stats, release_connection, timed_cursor
+from db.spool import SpoolError, write_through
+from db.stockRegistry import stock_registry
+from db.freshness import content_hash, crawl_times, record_crawl, stored_hash
+from db.checkpoint import add_resume_arguments, clear_checkpoint, load_checkpoint, save_checkpoint
+from browser.tableExtractor import extract_table
+from scripts.dividendPostback import DIVIDEND_URL, dividend_session, fetch_dividend_rows
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
@@ -21,6 +28,24 @@ from log import configure_logging
 
 load_dotenv()
 
+# 'http' replays the page's ASP.NET postbacks without a browser; 'browser' drives Chrome tabs
+DIVIDEND_FETCHER = os.getenv('DIVIDEND_FETCHER', 'http')
+DIVIDEND_BROWSER_FALLBACK = os.getenv('DIVIDEND_BROWSER_FALLBACK', '1') == '1'  # retry failed http symbols in Chrome
+DIVIDEND_CONCURRENCY = int(os.getenv('DIVIDEND_CONCURRENCY', 4))  # symbols crawled at once (tabs or requests)
+DIVIDEND_TAB_RECYCLE = int(os.getenv('DIVIDEND_TAB_RECYCLE', 50))  # symbols per tab before it is replaced
+DIVIDEND_TAB_FAILURES = int(os.getenv('DIVIDEND_TAB_FAILURES', 3))  # tabs failing to open in a row before the browser is relaunched
+DIVIDEND_BROWSER_RELAUNCHES = int(os.getenv('DIVIDEND_BROWSER_RELAUNCHES', 3))  # relaunches per crawl before giving up
+DIVIDEND_PROGRESS_EVERY = int(os.getenv('DIVIDEND_PROGRESS_EVERY', 25))  # symbols between throughput lines
+DIVIDEND_CHECKPOINT_MAX_AGE = int(os.getenv('DIVIDEND_CHECKPOINT_MAX_AGE', 96))  # hours an unfinished crawl stays resumable
+# 'fresh' crawls only symbols due for a check (see select_symbols); 'all' crawls the whole universe
+DIVIDEND_SCHEDULE = os.getenv('DIVIDEND_SCHEDULE', 'fresh')
+DIVIDEND_MAX_AGE_DAYS = int(os.getenv('DIVIDEND_MAX_AGE_DAYS', 30))  # symbols not crawled for this long are always due
+DIVIDEND_ROTATION_DAYS = int(os.getenv('DIVIDEND_ROTATION_DAYS', 20))  # runs to rotate through the whole universe
+DIVIDEND_ANNOUNCEMENT_DAYS = int(os.getenv('DIVIDEND_ANNOUNCEMENT_DAYS', 14))  # how far back announcements make a symbol due
+DIVIDEND_ANNOUNCEMENT_KEYWORDS = [keyword.strip() for keyword in os.getenv(
+    'DIVIDEND_ANNOUNCEMENT_KEYWORDS', 'book clos,agm,annual general meeting,dividend,bonus'
+).split(',') if keyword.strip()]
+
 try:
     logger, _ = configure_logging("dividend.log", "dividend")
     print(f"Log File Set! for dividend")
@@ -29,126 +54,155 @@ except:
 
 
 
+# Needs the unique key on dividend the upsert already relied on
+UPSERT_DIVIDEND_SQL = """
+    INSERT INTO dividend (stock_id, fiscal_year, cash_dividend, bonus_share, right_share, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    fiscal_year = VALUES(fiscal_year),
+    cash_dividend = VALUES(cash_dividend),
+    bonus_share = VALUES(bonus_share),
+    right_share = VALUES(right_share),
+    updated_at = VALUES(updated_at)
+"""
+
+
 def dividend_data_to_database(final_data):
-    logger.info("Connecting to the database...")
-    
+    """
+    Upserts a symbol's dividend rows through the local spool. Returns True once
+    they are committed to MySQL; rows MySQL did not take stay spooled for replay.
+    """
+    current_datetime = datetime.now(pytz.timezone('Asia/Kathmandu')).strftime('%Y-%m-%d %H:%M:%S')
+
+    if not stock_registry.symbols():
+        logger.warning("No stock data found")
+        return False
+
+    values = []
+    for row in final_data:
+        # Debugging: Print the structure and type of `row`
+        logger.debug(f"Processing row: {row}, Type of row: {type(row)}")
+
+        # Debugging: Ensure row is a dictionary
+        if not isinstance(row, dict):
+            logger.error(f"Row is not a dictionary: {row}")
+            continue
+
+        stock_id = stock_registry.stock_id(row['symbol'])
+        if stock_id is None:
+            logger.warning(f"Skipping row due to missing stock: {row}")
+            continue
+
+        try:
+            fiscal_year = row['fiscal_year']  # Ensure fiscal_year is treated as a string
+
+            # Correctly parse and convert the cash_dividend and bonus_share fields
+            cash_dividend = row['cash_dividend'].replace('%', '').strip()
+            bonus_share = row['bonus_share'].replace('%', '').strip()
+
+            # Convert empty strings to None
+            cash_dividend = float(cash_dividend) if cash_dividend else 0.0
+            bonus_share = float(bonus_share) if bonus_share else 0.0
+
+            right_share = row['right_share']  # Ensure right_share is treated as a string
+
+            values.append((stock_id, fiscal_year, cash_dividend, bonus_share, right_share, current_datetime, current_datetime))
+        except KeyError as e:
+            logger.error(f"Key error: {e} in row: {row}")
+        except Exception as error:
+            logger.error(f'Error preparing Dividend Data: {error}')
+
+    if not values:
+        return True
+
+    logger.info("Inserting/updating Dividend Data")
+    try:
+        return write_through('dividend', UPSERT_DIVIDEND_SQL, values)
+    except SpoolError as e:
+        logger.error(f"Dividend rows lost: {e}")
+        return False
+
+
+def store_dividends(symbol, final_data):
+    """
+    Writes `symbol`'s dividend rows unless they hash the same as last crawl,
+    then records the crawl in the freshness index.
+    """
+    digest = content_hash(final_data)
+    if digest == stored_hash('dividend', symbol):
+        logger.info(f"Dividend history unchanged for {symbol}")
+    elif final_data and not dividend_data_to_database(final_data):
+        # Leave the index alone so the symbol is retried on the next run
+        return
+    elif final_data:
+        logger.info(f"Dividend history changed for {symbol}")
+    record_crawl('dividend', symbol, digest)
+
+
+def announced_symbols(days=DIVIDEND_ANNOUNCEMENT_DAYS):
+    """
+    Symbols with an AGM, book-closure or dividend announcement in the last `days` days.
+    """
+    if not DIVIDEND_ANNOUNCEMENT_KEYWORDS:
+        return set()
     connection = None
     cursor = None
-    
     try:
-        connection = mysql.connector.connect(
-            host = os.getenv('MYSQL_HOST'),
-            user = os.getenv('MYSQL_USER'),
-            password = os.getenv('MYSQL_PASSWORD'),
-            name = os.getenv('MYSQL_DATABASE')
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        matches = ' OR '.join(['a.announcement LIKE %s'] * len(DIVIDEND_ANNOUNCEMENT_KEYWORDS))
+        cursor.execute(
+            f"SELECT DISTINCT s.symbol FROM announcements a JOIN stock s ON s.id = a.stock_id "
+            f"WHERE a.date >= CURDATE() - INTERVAL %s DAY AND ({matches})",
+            [days] + [f'%{keyword}%' for keyword in DIVIDEND_ANNOUNCEMENT_KEYWORDS]
         )
-        logger.info("Database connection established.")
-        
-        cursor = connection.cursor(dictionary=True)
-        current_datetime = datetime.now(pytz.timezone('Asia/Kathmandu')).strftime('%Y-%m-%d %H:%M:%S')
-        
-        cursor.execute('SELECT * FROM stock')
-        stock_rows = cursor.fetchall()
-
-        logger.info("Inserting/updating Dividend Data")
-        if stock_rows:
-            for row in final_data:
-                # Debugging: Print the structure and type of `row`
-                logger.debug(f"Processing row: {row}, Type of row: {type(row)}")
-                
-                # Debugging: Ensure row is a dictionary
-                if not isinstance(row, dict):
-                    logger.error(f"Row is not a dictionary: {row}")
-                    continue
-
-                stock = next((stock for stock in stock_rows if stock['symbol'] == row['symbol']), None)
-
-                if stock:
-                    try:
-                        stock_id = stock['id']
-                        fiscal_year = row['fiscal_year']  # Ensure fiscal_year is treated as a string
-
-                        # Correctly parse and convert the cash_dividend and bonus_share fields
-                        cash_dividend = row['cash_dividend'].replace('%', '').strip()
-                        bonus_share = row['bonus_share'].replace('%', '').strip()
-
-                        # Convert empty strings to None
-                        cash_dividend = float(cash_dividend) if cash_dividend else 0.0
-                        bonus_share = float(bonus_share) if bonus_share else 0.0
-
-                        right_share = row['right_share']  # Ensure right_share is treated as a string
-
-                        sql_dividend = """
-                            INSERT INTO dividend (stock_id, fiscal_year, cash_dividend, bonus_share, right_share, created_at, updated_at)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            ON DUPLICATE KEY UPDATE
-                            fiscal_year = VALUES(fiscal_year),
-                            cash_dividend = VALUES(cash_dividend),
-                            bonus_share = VALUES(bonus_share),
-                            right_share = VALUES(right_share),
-                            updated_at = VALUES(updated_at);
-                        """
-                        cursor.execute(sql_dividend, (
-                            stock_id,
-                            fiscal_year,
-                            cash_dividend,
-                            bonus_share,
-                            right_share,
-                            current_datetime,
-                            current_datetime
-                        ))
-                    except KeyError as e:
-                        logger.error(f"Key error: {e} in row: {row}")
-                    except Exception as error:
-                        logger.error(f'Error during Dividend Data Insertion: {error}')
-                else:
-                    logger.warning(f"Skipping row due to missing stock: {row}")
-
-            connection.commit()  # Ensure the transaction is committed
-        else:
-            logger.warning("No stock data found")
+        return {symbol for symbol, in cursor.fetchall()}
+    except mysql.connector.Error as err:
+        logger.error(f"Error fetching dividend announcements: {err}")
+        return set()
+    finally:
+        release_connection(connection, cursor)
 
-    except Exception as e:
-        logger.error(f"Connection to database failed: {e}")
 
-    finally:
-        if cursor is not None:
-            cursor.close()
-        if connection is not None and connection.is_connected():
-            connection.close()
-            logger.info("Database connection closed.")
+def select_symbols(symbols):
+    """
+    Picks the symbols due for a dividend check: never crawled or older than
+    DIVIDEND_MAX_AGE_DAYS, announced an AGM/book closure recently, plus the
+    least recently crawled 1/DIVIDEND_ROTATION_DAYS of the universe.
+    """
+    crawled = crawl_times('dividend')
+    cutoff = time.time() - DIVIDEND_MAX_AGE_DAYS * 86400
+    stale = [symbol for symbol in symbols if crawled.get(symbol, 0) < cutoff]
+    recent = announced_symbols()
+    announced = [symbol for symbol in symbols if symbol in recent]
+
+    chosen = set(stale) | set(announced)
+    slice_size = -(-len(symbols) // max(DIVIDEND_ROTATION_DAYS, 1))
+    rotation = sorted((symbol for symbol in symbols if symbol not in chosen), key=lambda symbol: crawled.get(symbol, 0))[:slice_size]
+
+    due = list(dict.fromkeys(announced + stale + rotation))
+    logger.info(f"Dividend schedule: {len(due)}/{len(symbols)} symbols due "
+                f"({len(stale)} stale, {len(announced)} announced, {len(rotation)} rotating)")
+    return due
 
 
 def fetch_stock_symbols():
     try:
-        conn = mysql.connector.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME')
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT symbol FROM stock")
-        stocks = cursor.fetchall()
-        stock_symbols = [symbol for (symbol,) in stocks]
-        cursor.close()
-        conn.close()
-        return stock_symbols
+        return stock_registry.symbols()
     except mysql.connector.Error as err:
         logger.error(f"Error fetching stock symbols: {err}")
         sys.exit(1)
  
 
-async def scrape_dividend_data(symbol):
+async def scrape_dividend_data(page, symbol):
+    """
+    Scrapes every dividend page of `symbol` in the given tab and returns the rows as dictionaries.
+    """
     logger.info(f"Starting scraping for symbol: {symbol}")
-    
-    # Set up browser options
-    browser = await create_browser()
-    page = await browser.newPage()
 
     try:
         # Open the website
-        website = f'https://merolagani.com/CompanyDetail.aspx?symbol={symbol}'
+        website = DIVIDEND_URL.format(symbol=symbol)
         await page.goto(website)
         logger.info(f"Opened website: {website}")
 
@@ -163,29 +217,18 @@ async def scrape_dividend_data(symbol):
             # Wait for the table to load and extract headers
             await page.waitForXPath('//*[@id="ctl00_ContentPlaceHolder1_CompanyDetail1_divDividendData"]/div[2]/table/tbody/tr[1]', timeout=60000)
             await page.waitFor(10000)  # Wait for 10 seconds
-            headers = await page.xpath('//*[@id="ctl00_ContentPlaceHolder1_CompanyDetail1_divDividendData"]/div[2]/table/tbody/tr[1]')
+            header_cells, _ = await extract_table(
+                page,
+                header_xpath='//*[@id="ctl00_ContentPlaceHolder1_CompanyDetail1_divDividendData"]/div[2]/table/tbody/tr[1]//th[position()>1]',
+                text_property='textContent'
+            )
             header = ["symbol"]  # Add symbol as the first header
-            for row in headers:
-                cells = await row.xpath('.//th[position()>1]')
-                cell_data = [
-                    await page.evaluate('(element) => element.textContent', cell)
-                    for cell in cells
-                ]
-                cell_data = [
-                    cell.strip().lower()
-                    .replace('Fiscal Year', "fiscal_year")
-                    .replace('Cash Dividend', 'cash_dividend')
-                    .replace('Bonus Share', 'bonus_share')
-                    .replace('Right Share', "right_share")
-                    .replace(' ', '_')  # Replace spaces with underscores
-                    for cell in cell_data
-                ]
-                header.extend(cell_data)
-                logger.info(f"Extracted headers: {header}")
+            header.extend(header_cells)
+            logger.info(f"Extracted headers: {header}")
         except Exception as e:
             logger.error(f"Header Element Not Found Or Dividend Doesn't Exists for symbol {symbol}")
             logger.error(f"Header Table not present, Timeout Occurred for Finding Headers.")
-            return
+            return []
 
         all_data = []
         page_number = 1
@@ -196,14 +239,13 @@ async def scrape_dividend_data(symbol):
             logger.info(f"Processing page {page_number} for Symbol/Company {symbol}")
             try:
                 # Extract data from the current page
-                rows = await page.xpath('//*[@id="ctl00_ContentPlaceHolder1_CompanyDetail1_divDividendData"]/div[2]/table/tbody/tr[position()>1]')
-                for row in rows:
-                    cells = await row.xpath('.//td[position()>1]')
-                    cell_data = [
-                        await page.evaluate('(element) => element.textContent', cell)
-                        for cell in cells
-                    ]
-                    cell_data = [cell.strip() for cell in cell_data]
+                _, rows = await extract_table(
+                    page,
+                    row_xpath='//*[@id="ctl00_ContentPlaceHolder1_CompanyDetail1_divDividendData"]/div[2]/table/tbody/tr[position()>1]',
+                    cell_xpath='.//td[position()>1]',
+                    text_property='textContent'
+                )
+                for cell_data in rows:
                     cell_data.insert(0, symbol)  # Insert the symbol at the beginning of the row
                     all_data.append(cell_data)
                 logger.info(f"Extracted data: {all_data}")
@@ -244,43 +286,266 @@ async def scrape_dividend_data(symbol):
         if header and all_data:
             final_data = [dict(zip(header, row)) for row in all_data]
             logger.info(f"Final data converted to dictionaries")
-            dividend_data_to_database(final_data) 
-        else:
-            return []
+            return final_data
+        return []
     except KeyboardInterrupt:
         logger.warning("Data extraction interrupted by user.")
-        if browser:
-            await close_browser(browser, page)
+        return []
+
+
+async def close_tab(page):
+    report_page_metrics(page)
+    try:
+        await page.close()
     except Exception as e:
-        logger.error(f"Unexpected error occurred: {e}")
-        if browser:
-            await close_browser(browser, page)
+        logger.error(f"Error closing dividend tab: {e}")
+
+
+class CrawlBrowser:
+    """
+    The browser shared by a crawl's tabs. When tabs keep failing to open, the
+    first worker to notice discards it from the pool and leases a fresh one;
+    the other workers move to the new one.
+    """
+    def __init__(self):
+        self.browser = None
+        self.generation = 0
+        self.relaunches = 0
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self.browser = await acquire_browser()
+
+    async def relaunch(self, generation):
+        """
+        Replaces the browser of `generation` unless another worker already did.
+        Returns False once DIVIDEND_BROWSER_RELAUNCHES is used up.
+        """
+        async with self._lock:
+            if generation != self.generation:
+                return True
+            if self.relaunches >= DIVIDEND_BROWSER_RELAUNCHES:
+                return False
+            self.relaunches += 1
+            logger.warning(f"Relaunching the dividend browser ({self.relaunches}/{DIVIDEND_BROWSER_RELAUNCHES})")
+            browser, self.browser = self.browser, None
+            try:
+                await discard_browser(browser)
+            except Exception as e:
+                logger.error(f"Error closing the failed dividend browser: {e}")
+            self.browser = await acquire_browser()
+            self.generation += 1
+            return True
+
+    async def close(self):
+        if self.browser is not None:
+            await release_browser(self.browser)
+
+
+async def dividend_worker(crawl, symbols, progress):
+    """
+    Drives one tab, taking symbols from the queue until it is empty.
+    The tab is replaced after DIVIDEND_TAB_RECYCLE symbols or an error. When
+    DIVIDEND_TAB_FAILURES tabs in a row fail to open, the browser is
+    relaunched; the symbol goes back on the queue meanwhile.
+    """
+    loop = asyncio.get_event_loop()
+    page = None
+    served = 0
+    generation = crawl.generation
+    tab_failures = 0
+    try:
+        while True:
+            try:
+                symbol = symbols.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            try:
+                if page is None or served >= DIVIDEND_TAB_RECYCLE or generation != crawl.generation:
+                    if page is not None:
+                        await close_tab(page)
+                        page = None
+                    generation = crawl.generation
+                    try:
+                        page = await new_page(crawl.browser, DIVIDEND_URL, logger)
+                    except Exception as e:
+                        tab_failures += 1
+                        logger.error(f"Could not open a dividend tab ({tab_failures} in a row): {e}")
+                        if tab_failures >= DIVIDEND_TAB_FAILURES:
+                            if not await crawl.relaunch(generation):
+                                raise
+                            tab_failures = 0
+                        symbols.put_nowait(symbol)
+                        continue
+                    tab_failures = 0
+                    served = 0
+                served += 1
+
+                final_data = await scrape_dividend_data(page, symbol)
+                await loop.run_in_executor(None, store_dividends, symbol, final_data)
+                progress['done'] += 1
+                mark_done(progress, symbol)
+            except Exception as e:
+                logger.error(f"Unexpected error occurred for {symbol}: {e}")
+                progress['failed'] += 1
+                if page is not None:
+                    await close_tab(page)
+                    page = None
+            finally:
+                symbols.task_done()
+                log_progress(progress)
     finally:
-        await close_browser(browser, page)
+        if page is not None:
+            await close_tab(page)
 
 
-def process_symbol(symbol):
+async def http_dividend_worker(session, symbols, progress, failed):
+    """
+    Fetches symbols from the queue over plain HTTP until it is empty; symbols
+    that fail are collected in `failed`.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            symbol = symbols.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        try:
+            final_data = await fetch_dividend_rows(session, symbol)
+            await loop.run_in_executor(None, store_dividends, symbol, final_data)
+            progress['done'] += 1
+            mark_done(progress, symbol)
+        except Exception as e:
+            logger.error(f"Postback fetch failed for {symbol}: {e}")
+            progress['failed'] += 1
+            failed.append(symbol)
+        finally:
+            symbols.task_done()
+            log_progress(progress)
+
+
+def mark_done(progress, symbol):
+    """
+    Records `symbol` in the run's checkpoint so a restarted crawl skips it.
+    """
+    checkpoint = progress.get('checkpoint')
+    if checkpoint is None:
+        return
+    checkpoint['done'].append(symbol)
     try:
-        asyncio.run(scrape_dividend_data(symbol))
-    except Exception as e:
-        print(f"Error processing {symbol}: {e}")
+        save_checkpoint('dividend', checkpoint)
+    except OSError as e:
+        logger.error(f"Could not save dividend checkpoint: {e}")
+
+
+def log_progress(progress, final=False):
+    finished = progress['done'] + progress['failed']
+    if not final and finished % DIVIDEND_PROGRESS_EVERY:
+        return
+    minutes = (time.monotonic() - progress['started']) / 60
+    rate = finished / minutes if minutes else 0.0
+    logger.info(f"Dividend crawl {'finished' if final else 'progress'}: {finished}/{progress['total']} symbols "
+                f"({progress['failed']} failed) in {minutes:.1f} min, {rate:.1f} symbols/min with {progress['tabs']} {progress['mode']} workers")
+
+
+def _symbol_queue(symbols, concurrency, mode, checkpoint=None):
+    queue = asyncio.Queue()
+    for symbol in symbols:
+        queue.put_nowait(symbol)
+    workers = max(1, min(concurrency, len(symbols)))
+    progress = {'done': 0, 'failed': 0, 'total': len(symbols), 'tabs': workers, 'mode': mode,
+                'started': time.monotonic(), 'checkpoint': checkpoint}
+    return queue, workers, progress
+
+
+async def crawl_dividends(symbols, concurrency=DIVIDEND_CONCURRENCY, fetcher=DIVIDEND_FETCHER, checkpoint=None):
+    """
+    Crawls the symbols with up to `concurrency` workers pulling from a shared
+    queue: HTTP postback fetchers, or tabs in one browser. Symbols the HTTP
+    fetcher cannot handle are retried in the browser when
+    DIVIDEND_BROWSER_FALLBACK is set. Finished symbols are appended to
+    `checkpoint['done']` as they complete.
+    """
+    if fetcher == 'http':
+        queue, workers, progress = _symbol_queue(symbols, concurrency, 'http', checkpoint)
+        failed = []
+        try:
+            async with dividend_session(workers) as session:
+                await asyncio.gather(*(http_dividend_worker(session, queue, progress, failed) for _ in range(workers)))
+        finally:
+            log_progress(progress, final=True)
 
-def pool_process():
-    symbols = fetch_stock_symbols()
+        if not failed or not DIVIDEND_BROWSER_FALLBACK:
+            return
+        logger.warning(f"Retrying {len(failed)} symbols in the browser")
+        symbols = failed
 
-    with ProcessPoolExecutor(max_workers=6) as executor:
-        executor.map(process_symbol, symbols)
+    queue, tabs, progress = _symbol_queue(symbols, concurrency, 'browser', checkpoint)
 
-def job():
-    pool_process()
+    crawl = CrawlBrowser()
+    await crawl.start()
+    try:
+        await asyncio.gather(*(dividend_worker(crawl, queue, progress) for _ in range(tabs)))
+    finally:
+        await crawl.close()
+        log_progress(progress, final=True)
+
+
+def run_checkpointed_crawl(checkpoint):
+    """
+    Crawls the symbols of `checkpoint` not done yet and drops the checkpoint
+    once every symbol is done. Returns True if the crawl is complete.
+    """
+    done = set(checkpoint['done'])
+    symbols = [symbol for symbol in checkpoint['symbols'] if symbol not in done]
+    if done:
+        logger.info(f"Resuming dividend crawl of {checkpoint['run']}: {len(done)} of {len(checkpoint['symbols'])} symbols already done")
+    if symbols:
+        run_async(crawl_dividends(symbols, checkpoint=checkpoint))
+    complete = len(set(checkpoint['done'])) >= len(checkpoint['symbols'])
+    if complete:
+        clear_checkpoint('dividend')
+    return complete
+
+
+def job(resume=True):
+    """
+    Runs the dividend crawl. With `resume`, an unfinished crawl (from today or
+    an earlier run up to DIVIDEND_CHECKPOINT_MAX_AGE hours old) first
+    continues with the symbols its checkpoint has not finished; a crawl left
+    over from an earlier day is then followed by today's selection.
+    """
+    try:
+        today = str(datetime.now(pytz.timezone('Asia/Kathmandu')).date())
+        checkpoint = load_checkpoint('dividend') if resume else None
+        if checkpoint is not None and time.time() - checkpoint.get('started_at', 0) > DIVIDEND_CHECKPOINT_MAX_AGE * 3600:
+            logger.warning(f"Discarding dividend checkpoint of {checkpoint.get('run')}, older than {DIVIDEND_CHECKPOINT_MAX_AGE}h")
+            checkpoint = None
+        if checkpoint is not None:
+            run_checkpointed_crawl(checkpoint)
+            if checkpoint['run'] == today:
+                return
+
+        symbols = fetch_stock_symbols()
+        if DIVIDEND_SCHEDULE != 'all':
+            symbols = select_symbols(symbols)
+        checkpoint = {'run': today, 'started_at': time.time(), 'symbols': symbols, 'done': []}
+        save_checkpoint('dividend', checkpoint)
+        run_checkpointed_crawl(checkpoint)
+    except Exception as e:
+        logger.error(f"Error while running dividend crawl: {e}")
+    finally:
+        log_query_stats(logger)
 
 
-def dividend():
+def dividend(resume=True):
     while True:
         try:
             logger.info("Initializing schedule_jobs for Dividend...")
             # Schedule the job to run at 11:20 AM every day
-            schedule.every().day.at("15:30").do(job)
+            schedule.every().day.at("15:30").do(job, resume=resume)
             logger.info("Job scheduled successfully For Dividend.")
 
             while True:
@@ -299,4 +564,5 @@ def dividend():
             
 
 if __name__ == "__main__":
-    dividend()
+    args = add_resume_arguments(argparse.ArgumentParser(description="Dividend crawl")).parse_args()
+    job(resume=args.resume)
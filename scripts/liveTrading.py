@@ -1,4 +1,6 @@
 import asyncio
+from array import array
+import heapq
 from datetime import datetime, time as dt_time
 import logging
 import os
@@ -8,13 +10,16 @@ from pyppeteer import launch
 from pyppeteer.errors import TimeoutError
 import schedule
 import time
-from mysql.connector import errorcode
-import mysql.connector
 from dotenv import load_dotenv
-from .marketcheck import scrape_market_status
+from .marketcheck import get_market_status
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import acquire_browser, new_page, release_browser, run_async
+from db.connectionPool import log_query_stats
+from db.dbWriter import db_writer
+from db.stockRegistry import stock_registry
+from browser.tableExtractor import extract_table
+from browser.responseCapture import ResponseCapture
 from log import configure_logging
 
 load_dotenv()
@@ -22,6 +27,102 @@ load_dotenv()
 # URL for live market data
 url = "https://www.nepalstock.com.np/live-market"
 
+LIVE_TABLE_XPATH = '/html/body/app-root/div/main/div/app-live-market/div/div/div[5]/table'
+
+# 'poll' re-reads the table every 10 seconds; 'push' streams changed rows from a MutationObserver
+LIVE_MARKET_MODE = os.getenv('LIVE_MARKET_MODE', 'poll')
+LIVE_MARKET_PUSH_FLUSH = float(os.getenv('LIVE_MARKET_PUSH_FLUSH', 1))  # seconds of changes coalesced per insert
+LIVE_MARKET_PUSH_IDLE = int(os.getenv('LIVE_MARKET_PUSH_IDLE', 60))  # seconds without changes before re-attaching
+
+# Watches the live table and calls window[callbackName] with the cells (without SN)
+# of every body row whose text changed. Changes are batched per 50 ms; returns
+# false if the table is missing or already observed.
+OBSERVE_TABLE_JS = '''
+(tableXPath, callbackName) => {
+    const table = document.evaluate(tableXPath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (!table || table.__liveObserver) {
+        return false;
+    }
+    const last = new Map();
+    let pending = new Set();
+    let scheduled = false;
+
+    const cells = (row) => Array.from(row.querySelectorAll(':scope > td')).slice(1).map(td => td.innerText.trim());
+    const flush = () => {
+        scheduled = false;
+        const changed = [];
+        for (const row of pending) {
+            if (!row.isConnected) {
+                continue;
+            }
+            const values = cells(row);
+            const signature = values.join('|');
+            if (values.length && last.get(values[0]) !== signature) {
+                last.set(values[0], signature);
+                changed.push(values);
+            }
+        }
+        pending = new Set();
+        if (changed.length) {
+            window[callbackName](changed);
+        }
+    };
+    const queue = (row) => {
+        if (!row || !row.parentElement || row.parentElement.tagName !== 'TBODY') {
+            return;
+        }
+        pending.add(row);
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(flush, 50);
+        }
+    };
+
+    table.__liveObserver = new MutationObserver(mutations => {
+        for (const mutation of mutations) {
+            const target = mutation.target.nodeType === Node.ELEMENT_NODE ? mutation.target : mutation.target.parentElement;
+            if (target && target.closest('tr')) {
+                queue(target.closest('tr'));
+            }
+            mutation.addedNodes.forEach(node => {
+                if (node.nodeName === 'TR') {
+                    queue(node);
+                } else if (node.querySelectorAll) {
+                    node.querySelectorAll('tbody > tr').forEach(queue);
+                }
+            });
+        }
+    });
+    table.__liveObserver.observe(table, {childList: true, subtree: true, characterData: true});
+    table.querySelectorAll('tbody > tr').forEach(queue);
+    return true;
+}
+'''
+
+# Reads the live table straight into (symbols, flat numeric values) in the
+# SNAPSHOT_FIELDS layout; cell columns exclude SN and -1 means "not shown"
+LIVE_TABLE_VALUES_JS = '''
+(rowXPath, symbolColumn, columns) => {
+    const result = document.evaluate(rowXPath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const symbols = [];
+    const values = [];
+    for (let i = 0; i < result.snapshotLength; i++) {
+        const cells = Array.from(result.snapshotItem(i).querySelectorAll(':scope > td')).slice(1).map(td => td.innerText);
+        symbols.push((cells[symbolColumn] || '').trim());
+        for (const column of columns) {
+            const value = column < 0 ? NaN : parseFloat((cells[column] || '').replace(/,/g, ''));
+            values.push(Number.isFinite(value) ? value : 0);
+        }
+    }
+    return {symbols: symbols, values: values};
+}
+'''
+
+# Numeric fields per symbol, in snapshot matrix column order
+SNAPSHOT_FIELDS = ('ltp', 'ltv', 'point_change', 'percentage_change', 'open_price', 'high_price',
+                   'low_price', 'avg_traded_price', 'volume', 'previous_closing')
+LIVE_SNAPSHOT_MAX_SYMBOLS = int(os.getenv('LIVE_SNAPSHOT_MAX_SYMBOLS', 2000))
+
 # Configure logging
 try:
     logger, _ = configure_logging("liveTrading.log", "live_stock")
@@ -30,74 +131,283 @@ except Exception as e:
     print(f"Logger Setting Error: {e}")
 
 
+def live_market_values(payload):
+    """
+    Maps lives-market API items onto (symbols, values), values being a flat
+    list of SNAPSHOT_FIELDS per symbol; missing numbers become 0.
+    """
+    symbols = []
+    values = []
+    for item in payload:
+        ltp = item.get('lastTradedPrice')
+        previous_close = item.get('previousClose')
+        point_change = item.get('pointChange')
+        if point_change is None and ltp is not None and previous_close is not None:
+            point_change = round(ltp - previous_close, 2)
+        symbols.append(str(item.get('symbol')))
+        values.extend(float(value or 0) for value in (
+            ltp,
+            item.get('lastTradedVolume'),
+            point_change,
+            item.get('percentageChange'),
+            item.get('openPrice'),
+            item.get('highPrice'),
+            item.get('lowPrice'),
+            item.get('averageTradedPrice'),
+            item.get('totalTradeQuantity'),
+            previous_close,
+        ))
+    return symbols, values
+
+
+def table_columns(headers):
+    """
+    Returns the symbol column and the column of each SNAPSHOT_FIELD (-1 when missing) in the live table.
+    """
+    return headers.index('symbol'), [headers.index(field) if field in headers else -1 for field in SNAPSHOT_FIELDS]
+
+
+def cells_to_values(rows, symbol_column, columns):
+    """
+    Parses the pushed cell texts of changed rows into (symbols, values).
+    """
+    symbols = []
+    values = []
+    for cells in rows:
+        symbols.append(cells[symbol_column].strip())
+        for column in columns:
+            try:
+                values.append(float(cells[column].replace(',', '')) if 0 <= column < len(cells) else 0.0)
+            except ValueError:
+                values.append(0.0)
+    return symbols, values
+
+
+class LiveSnapshots:
+    """
+    Snapshot matrix of symbols x SNAPSHOT_FIELDS held in one array('d').
+
+    Each tick is loaded as a flat array in the same layout and compared with
+    the stored rows through memoryview slices, so the diff runs in C. Holds at
+    most `max_symbols` symbols, evicting the ones missing from ticks longest
+    to make room, and starts empty on each trading day.
+    """
+    def __init__(self, max_symbols=LIVE_SNAPSHOT_MAX_SYMBOLS):
+        self.max_symbols = max_symbols
+        self.width = len(SNAPSHOT_FIELDS)
+        self.reset()
+
+    def reset(self):
+        self._rows = {}
+        self._symbols = []
+        self._values = array('d')
+        self._seen = []  # tick each row was last part of
+        self._tick = 0
+        self._full_tick = 0  # last tick that held every stored symbol
+        self._session = datetime.now().date()
+
+    def _last_seen(self, symbol):
+        return max(self._seen[self._rows[symbol]], self._full_tick)
+
+    def _make_room(self, tick_symbols, needed):
+        """
+        Evicts up to `needed` stored symbols that are not in this tick, least
+        recently seen first, and returns their free rows.
+        """
+        candidates = (symbol for symbol in self._rows if symbol not in tick_symbols)
+        evicted = heapq.nsmallest(needed, candidates, key=self._last_seen)
+        if evicted:
+            logger.info(f"Live snapshot store full, evicting {len(evicted)} symbols: {evicted}")
+        return [self._rows.pop(symbol) for symbol in evicted]
+
+    def update(self, symbols, values):
+        """
+        Stores a tick and returns the symbols whose values changed (or are new).
+        A symbol listed more than once keeps its last values and is returned once.
+        New symbols that still do not fit once older ones are evicted are skipped.
+        """
+        if self._session != datetime.now().date():
+            self.reset()
+
+        width = self.width
+        tick = array('d', values)
+        self._tick += 1
+
+        # Same symbols in the same order and nothing moved: one comparison for the whole tick
+        if symbols == self._symbols and memoryview(tick) == memoryview(self._values):
+            self._full_tick = self._tick
+            return []
+
+        tick_symbols = dict.fromkeys(symbols)
+        new_symbols = [symbol for symbol in tick_symbols if symbol not in self._rows]
+        free_rows = []
+        room = self.max_symbols - len(self._rows)
+        if len(new_symbols) > room:
+            free_rows = self._make_room(tick_symbols, len(new_symbols) - room)
+            room += len(free_rows)
+            if len(new_symbols) > room:
+                logger.warning(f"Live snapshot store holds at most {self.max_symbols} symbols, "
+                               f"skipping {len(new_symbols) - room}: {new_symbols[room:]}")
+                new_symbols = new_symbols[:room]
+        blank = array('d', [float('nan')] * width)  # NaN never compares equal, so new rows count as changed
+        for symbol in new_symbols:
+            if free_rows:
+                row = free_rows.pop()
+                self._symbols[row] = symbol
+                self._values[row * width:(row + 1) * width] = blank
+            else:
+                row = len(self._symbols)
+                self._symbols.append(symbol)
+                self._values.extend(blank)
+                self._seen.append(0)
+            self._rows[symbol] = row
+
+        stored = memoryview(self._values)
+        incoming = memoryview(tick)
+        changed = []
+        for position, symbol in enumerate(symbols):
+            index = self._rows.get(symbol)
+            if index is None:
+                continue
+            self._seen[index] = self._tick
+            start = index * width
+            row = incoming[position * width:(position + 1) * width]
+            if stored[start:start + width] != row:
+                stored[start:start + width] = row
+                changed.append(symbol)
+        stored.release()
+        return list(dict.fromkeys(changed))
+
+    def rows(self, symbols):
+        """
+        Returns the stored values of `symbols` as row dicts for the database writer.
+        """
+        rows = []
+        for symbol in symbols:
+            start = self._rows[symbol] * self.width
+            row = dict(zip(SNAPSHOT_FIELDS, self._values[start:start + self.width]))
+            row['symbol'] = symbol
+            rows.append(row)
+        return rows
+
+
+live_snapshots = LiveSnapshots()
+
+
+def store_changes(symbols, values):
+    """
+    Loads a tick into the snapshot matrix and inserts the symbols that changed.
+    """
+    changed = live_snapshots.update(symbols, values)
+
+    logger.info(f"Extracted {len(changed)} new rows of data.")
+
+    if changed:
+        insert_data_into_database(live_snapshots.rows(changed))
+
+
+async def poll_table(page, capture, headers):
+    """
+    Re-reads the whole table (or the JSON behind it) every 10 seconds until the break time.
+    """
+    break_time = dt_time(15, 1)
+    symbol_column, columns = table_columns(headers)
+
+    while True:
+        logger.info("Extracting rows...")
+
+        try:
+            # Use the JSON the page fetched since the last tick, else read the table
+            payload = capture.latest('live_market')
+            if payload is not None:
+                capture.clear('live_market')
+                symbols, values = live_market_values(payload)
+            else:
+                table = await page.evaluate(LIVE_TABLE_VALUES_JS, LIVE_TABLE_XPATH + '/tbody/tr', symbol_column, columns)
+                symbols, values = table['symbols'], table['values']
+
+            store_changes(symbols, values)
+
+            # Check if it's time to break the loop
+            current_time = datetime.now().time()
+            if current_time >= break_time:
+                logger.info(f"Reached break time ({break_time}). Exiting loop.")
+                break
+
+            # Yield to the event loop so captured responses are processed
+            await asyncio.sleep(10)
+
+        except Exception as e:
+            logger.error(f"Error extracting data: {e}")
+
+
+async def watch_table(page, headers):
+    """
+    Push mode: a MutationObserver in the page reports only the rows whose cells
+    changed, and they are stored as they arrive until the break time.
+    """
+    changes = asyncio.Queue()
+    await page.exposeFunction('onLiveRows', changes.put_nowait)
+
+    break_time = dt_time(15, 1)
+    symbol_column, columns = table_columns(headers)
+    loop = asyncio.get_event_loop()
+    last_change = time.monotonic()
+    installed = await page.evaluate(OBSERVE_TABLE_JS, LIVE_TABLE_XPATH, 'onLiveRows')
+    logger.info(f"Live table observer {'installed' if installed else 'not installed, table not found'}")
+
+    while datetime.now().time() < break_time:
+        try:
+            rows = await asyncio.wait_for(changes.get(), timeout=LIVE_MARKET_PUSH_FLUSH)
+        except asyncio.TimeoutError:
+            # Re-attach if the table was re-rendered or never found
+            if time.monotonic() - last_change >= LIVE_MARKET_PUSH_IDLE:
+                installed = await page.evaluate(OBSERVE_TABLE_JS, LIVE_TABLE_XPATH, 'onLiveRows')
+                logger.info(f"No live table changes for {LIVE_MARKET_PUSH_IDLE}s, observer {'re-attached' if installed else 'still attached'}")
+                last_change = time.monotonic()
+            continue
+
+        # Coalesce everything that arrived within the flush window into one insert
+        await asyncio.sleep(LIVE_MARKET_PUSH_FLUSH)
+        while not changes.empty():
+            rows.extend(changes.get_nowait())
+        last_change = time.monotonic()
+
+        symbols, values = cells_to_values(rows, symbol_column, columns)
+        logger.info(f"Observer pushed {len(symbols)} changed rows")
+        try:
+            await loop.run_in_executor(None, store_changes, symbols, values)
+        except Exception as e:
+            logger.error(f"Error storing pushed rows: {e}")
+
+    logger.info(f"Reached break time ({break_time}). Exiting loop.")
+
+
 async def live_market():
     browser = None
     page = None
 
     try:
-        logger.info("Creating a new browser instance...")
-        browser = await create_browser()
-        page = await browser.newPage()
+        logger.info("Leasing a browser from the pool...")
+        browser = await acquire_browser()
+        page = await new_page(browser, url, logger)
+        capture = ResponseCapture(page, ['live_market'])
 
         logger.info("Navigating to the URL...")
         await page.goto(url)
-        await page.waitForXPath('/html/body/app-root/div/main/div/app-live-market/div/div/div[5]/table/thead', timeout=60000)
+        await capture.wait_for('live_market', timeout=30)
+        await page.waitForXPath(LIVE_TABLE_XPATH + '/thead', timeout=60000)
 
         logger.info("Extracting headers...")
-        headers_xpath = '/html/body/app-root/div/main/div/app-live-market/div/div/div[5]/table/thead/tr/th[position()>1]'  # Avoid first column (SN)
-        headers_elements = await page.xpath(headers_xpath)
-
-        headers = []
-        for element in headers_elements:
-            header_text = await page.evaluate('(element) => element.innerText', element)
-            header_text = header_text.lower().replace('%', 'percentage').replace(' ', '_')
-            headers.append(header_text)
-        
-        logger.info(f"Headers extracted: {headers}")
-
-        data_size = []
+        headers_xpath = LIVE_TABLE_XPATH + '/thead/tr/th[position()>1]'  # Avoid first column (SN)
+        headers, _ = await extract_table(page, header_xpath=headers_xpath, header_replacements=[('%', 'percentage')])
 
-        break_time = dt_time(15, 1)
-
-        while True:
-            logger.info("Extracting rows...")
-
-            try:
-                rows_xpath = '/html/body/app-root/div/main/div/app-live-market/div/div/div[5]/table/tbody/tr'
-                rows_elements = await page.xpath(rows_xpath)
-                new_data = []
-
-                for row in rows_elements:
-                    row_data = {}
-                    cell_elements = await row.xpath('td[position()>1]')  # Avoid first column (SN)
-                    for i, cell in enumerate(cell_elements):
-                        cell_text = await page.evaluate('(element) => element.innerText', cell)
-                        cell_text = cell_text.replace(',', '').strip()
-                        row_data[headers[i]] = cell_text
-                    
-                    if row_data not in data_size:
-                        new_data.append(row_data)
-                        data_size.append(row_data)
-                
-                logger.info(f"Extracted {len(new_data)} new rows of data.")
-
-                if new_data:
-                    insert_data_into_database(new_data)
-
-                # Limit the size of data_size to 4000 by removing oldest entries
-                if len(data_size) > 4000:
-                    data_size = data_size[-2000:]
-
-                # Check if it's time to break the loop
-                current_time = datetime.now().time()
-                if current_time >= break_time:
-                    logger.info(f"Reached break time ({break_time}). Exiting loop.")
-                    break
-            
-                time.sleep(10)
+        logger.info(f"Headers extracted: {headers}")
 
-            except Exception as e:
-                logger.error(f"Error extracting data: {e}")
+        if LIVE_MARKET_MODE == 'push':
+            await watch_table(page, headers)
+        else:
+            await poll_table(page, capture, headers)
 
     except TimeoutError:
         logger.error("Timeout while loading the page or finding the element.")
@@ -106,113 +416,68 @@ async def live_market():
     finally:
         if browser:
             logger.info("Closing the browser...")
-            await close_browser(browser, page)
+            await release_browser(browser, page)
 
 
 
 def insert_data_into_database(final_data):
+    """
+    Maps the rows onto live_trading and hands them to the write-behind DB writer.
+    """
+    sql = """
+        INSERT INTO live_trading (
+            stock_id, LTP, LTV, point_change, percentage_change, open,
+            high, low, avg_trading_price, volume, previous_closing, 
+            created_at, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
 
-    try:
-        # Connect to the database
-        try:
-            connection = mysql.connector.connect(
-                host=os.getenv('MYSQL_HOST'),
-                user=os.getenv('MYSQL_USER'),
-                password=os.getenv('MYSQL_PASSWORD'),
-                database=os.getenv('MYSQL_DATABASE')
-            )
-            logger.info("Connection established.")
-            cursor = connection.cursor()
-        except mysql.connector.Error as err:
-            if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-                logger.error("Something is wrong with your user name or password")
-            elif err.errno == errorcode.ER_BAD_DB_ERROR:
-                logger.error("Database does not exist")
-            else:
-                logger.error(f"Database Connection Error: {err}")
-            raise
-
-        # Prepare the insert statement with placeholders
-        sql = """
-            INSERT INTO live_trading (
-                stock_id, LTP, LTV, point_change, percentage_change, open,
-                high, low, avg_trading_price, volume, previous_closing, 
-                created_at, updated_at
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        # Retrieve stock symbols and their IDs
-        cursor.execute("SELECT id, symbol FROM stock")
-        symbols = cursor.fetchall()
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        stock_dict = {symbol: stock_id for stock_id, symbol in symbols}
-        logger.info("Stock dictionary created.")
-        
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # Insert data into the database
-        for row in final_data:
-            stock_id = stock_dict.get(row['symbol'])
-            if stock_id is not None:
-                try:
-                    values = (
-                        stock_id,
-                        row['ltp'],
-                        row['ltv'],
-                        row['point_change'],
-                        row['percentage_change'],
-                        row['open_price'],
-                        row['high_price'],
-                        row['low_price'],
-                        row['avg_traded_price'],
-                        row['volume'],
-                        row['previous_closing'],
-                        current_time,
-                        current_time
-                    )
-                    cursor.execute(sql, values)
-                except KeyError as e:
-                    logger.error(f"Missing key in data row: {e}. Row data: {row}")
-                except Exception as e:
-                    logger.error(f"Error inserting row: {e}. Row data: {row}")
-            else:
-                logger.warning(f"No matching stock_id found for symbol {row['symbol']}")
-
-        # Commit the transaction
-        connection.commit()
-        logger.info("Data committed to the database.")
-
-    except mysql.connector.Error as err:
-        logger.error(f"Database error: {err}")
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            logger.error("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            logger.error("Database does not exist")
+    values = []
+    unmapped_symbols = []
+    for row in final_data:
+        stock_id = stock_registry.stock_id(row.get('symbol'))
+        if stock_id is not None:
+            try:
+                values.append((
+                    stock_id,
+                    row['ltp'],
+                    row['ltv'],
+                    row['point_change'],
+                    row['percentage_change'],
+                    row['open_price'],
+                    row['high_price'],
+                    row['low_price'],
+                    row['avg_traded_price'],
+                    row['volume'],
+                    row['previous_closing'],
+                    current_time,
+                    current_time
+                ))
+            except KeyError as e:
+                logger.error(f"Missing key in data row: {e}. Row data: {row}")
         else:
-            logger.error(str(err))
+            unmapped_symbols.append(row.get('symbol'))
+
+    if unmapped_symbols:
+        logger.warning(f"No matching stock_id found for {len(unmapped_symbols)} symbols: {', '.join(sorted(set(map(str, unmapped_symbols))))}")
+
+    try:
+        db_writer.submit('live_trading', sql, values)
+        logger.info(f"Queued {len(values)} of {len(final_data)} rows for the database writer.")
     except Exception as e:
-        logger.error(f"An unexpected error occurred during database operation: {e}")
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-                logger.info("Cursor closed.")
-            except Exception as e:
-                logger.error(f"Error closing cursor: {e}")
-        if connection and connection.is_connected():
-            try:
-                connection.close()
-                logger.info("Database connection closed.")
-            except Exception as e:
-                logger.error(f"Error closing connection: {e}")
+        logger.error(f"An unexpected error occurred while queueing rows for the database: {e}")
+
+
 def job():
     """
     Job function to be scheduled. It checks the market status and runs the scraper if conditions are met.
     """
     current_time = datetime.now().time()
     market_close_time = dt_time(15, 5)  # 3:05 PM
-    is_live = asyncio.run(scrape_market_status())
+    is_live = run_async(get_market_status())
     
     # Log current market status and time
     logger.info(f"Market live status: {'True' if is_live else 'False'}, Current time: {current_time}")
@@ -221,16 +486,13 @@ def job():
     if is_live or (dt_time(13, 1) <= current_time < market_close_time):
         logger.info("Starting the scraping process...")
         try:
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            loop.run_until_complete(live_market())
+            run_async(live_market())
         
         except Exception as e:
             logger.error(f"An error occurred during the scraping process in Job Function: {e}")
+        finally:
+            db_writer.flush()
+            log_query_stats(logger)
 
 
 def live_stock():
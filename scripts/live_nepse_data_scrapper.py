@@ -1,19 +1,19 @@
 import os
 import json
 from datetime import datetime, time as dt_time, timedelta
-import asyncio
 import sys
 import psutil
 import schedule
 from pyppeteer import launch
-import mysql.connector
-from mysql.connector import errorcode
 from dotenv import load_dotenv
 import time
-from .marketcheck import scrape_market_status
+from .marketcheck import get_market_status
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import acquire_browser, new_page, release_browser, run_async
+from db.connectionPool import log_query_stats
+from db.dbWriter import db_writer
+from db.stockRegistry import stock_registry
 from log import configure_logging
 
 
@@ -33,200 +33,135 @@ url = 'https://www.sharesansar.com/live-trading'
 
 browser_process_pids = []
 
-async def scrape_website():
-    browser = None 
+# Index cards to store, as named on the site
+index_names = [
+    'NEPSE Index', 'Non Life Insurance', 'Others Index', 'Sensitive Float Inde.',
+    'Sensitive Index', 'Trading Index', 'Banking SubIndex', 'Development Bank Ind.',
+    'Finance Index', 'Float Index', 'Hotels And Tourism', 'HydroPower Index',
+    'Investment', 'Life Insurance', 'Manufacturing And Pr.', 'Microfinance Index',
+    'Mutual Fund'
+]
+
+# Reads every index card of the carousel, including slides that are not shown,
+# in one round trip. bxSlider's cloned slides are only used when a card has no original.
+EXTRACT_INDICES_JS = '''
+() => {
+    const text = (card, selector) => {
+        const node = card.querySelector(selector);
+        return node ? node.textContent : '';
+    };
+    const headings = Array.from(document.querySelectorAll('.bx-viewport div > h4'));
+    headings.sort((a, b) => !!a.closest('.bx-clone') - !!b.closest('.bx-clone'));
+
+    const indices = {};
+    for (const heading of headings) {
+        const name = heading.textContent.trim();
+        if (!name || name in indices) {
+            continue;
+        }
+        const card = heading.parentElement;
+        indices[name] = {
+            turnover: text(card, 'p.mu-price'),
+            value: text(card, 'p span.mu-value'),
+            percent: text(card, 'p span.mu-percent')
+        };
+    }
+    const date = document.querySelector('#dDate');
+    return {date: date ? date.textContent : null, indices: indices};
+}
+'''
+
+
+def _to_float(text):
+    text = text.strip().replace(',', '')
+    return float(text) if text else 0.0
 
-    logger.info("Setting up the Pyppeteer Browser...")
-    browser = await create_browser() 
-    page = await browser.newPage()
-    await page.goto(url)
 
-    try:
-        # Wait for the main container to ensure the page is loaded
-        await page.waitForSelector('.bx-viewport', timeout=60000)
+async def scrape_website():
+    browser = None
+    page = None
+    extracted_data = []
 
-        # Define a list of all index names to search for
-        index_names = [
-            'NEPSE Index', 'Non Life Insurance', 'Others Index', 'Sensitive Float Inde.',
-            'Sensitive Index', 'Trading Index', 'Banking SubIndex', 'Development Bank Ind.',
-            'Finance Index', 'Float Index', 'Hotels And Tourism', 'HydroPower Index',
-            'Investment', 'Life Insurance', 'Manufacturing And Pr.', 'Microfinance Index',
-            'Mutual Fund'
-        ]
+    try:
+        logger.info("Setting up the Pyppeteer Browser...")
+        browser = await acquire_browser()
+        page = await new_page(browser, url, logger)
+        await page.goto(url)
 
-        extracted_data = []
+        # Wait for the carousel and the update date to be rendered
+        await page.waitForSelector('.bx-viewport', timeout=60000)
+        await page.waitForSelector('#dDate', timeout=60000)
 
-        date_xpath = '//*[@id="dDate"]'
-        date_element = await page.waitForXPath(date_xpath)
-        updated_date = await page.evaluate('(element) => element.textContent', date_element)
+        started = time.perf_counter()
+        result = await page.evaluate(EXTRACT_INDICES_JS)
+        logger.info(f"Read {len(result['indices'])} index cards in {(time.perf_counter() - started) * 1000:.0f} ms")
 
+        updated_date = result['date']
+        indices = result['indices']
 
         for name in index_names:
+            card = indices.get(name)
+            if card is None:
+                logger.error(f"Index '{name}' not found on the page")
+                continue
             try:
-                parent_container_xpath = '/html/body/div[2]/div/section[2]/div[3]/div/div/div/div/div[1]/div[3]/div[1]/div/div/div/div[1]/div'
-                await page.waitForXPath(parent_container_xpath, timeout=60000)
-
-                index_elements = await page.xpath(f"{parent_container_xpath}//div[h4/text()='{name}']")
-
-                found_matching_element = False
-
-                for index_element in index_elements:
-                    found_matching_element = True
-
-                    turnover_element = await index_element.querySelector('p.mu-price')
-                    turnover = await page.evaluate('(element) => element.textContent', turnover_element)
-                    turnover = turnover.strip()
-
-                    index_value_element = await index_element.querySelector('p span.mu-value')
-                    index_value = await page.evaluate('(element) => element.textContent', index_value_element)
-                    index_value = index_value.strip()
-
-                    percentage_change_element = await index_element.querySelector('p span.mu-percent')
-                    percentage_change_text = await page.evaluate('(element) => element.textContent', percentage_change_element)
-                    percentage_change_str = percentage_change_text.split('%')[0] + '%'
-                    percentage_change = percentage_change_str.strip().replace('\n', '')
-
-                    # Clean and convert data
-                    turnover_cleaned = float(turnover.replace(',', '')) if turnover else 0.0
-                    index_value_cleaned = float(index_value.replace(',', '')) if index_value else 0.0
-                    percentage_change_cleaned = float(percentage_change.replace('%', '')) if percentage_change else 0.0
-
-
-                    extracted_data.append({
-                        'index_name': name,
-                        'turnover': turnover_cleaned,
-                        'last_trading_index': index_value_cleaned,
-                        'percentage_change': percentage_change_cleaned,
-                        'date': updated_date
-                    })
-
-                    logger.info(f"Index Name: {name}, Turnover: {turnover_cleaned}, Last Trading Index: {index_value_cleaned}, Percentage Change: {percentage_change_cleaned}")
-                    break
-
-                if not found_matching_element:
-                    while True:
-                        button = await page.waitForXPath('/html/body/div[2]/div/section[2]/div[3]/div/div/div/div/div[1]/div[3]/div[1]/div/div/div/div[2]/div/a[2]', timeout=10000)
-                        await button.click()
-                        await page.waitForTimeout(1000)  # Wait for the page to update
-
-                        index_elements = await page.xpath(f"{parent_container_xpath}//div[h4/text()='{name}']")
-
-                        for index_element in index_elements:
-                            found_matching_element = True
-
-                            turnover_element = await index_element.querySelector('p.mu-price')
-                            turnover = await page.evaluate('(element) => element.textContent', turnover_element)
-                            turnover = turnover.strip()
-
-                            index_value_element = await index_element.querySelector('p span.mu-value')
-                            index_value = await page.evaluate('(element) => element.textContent', index_value_element)
-                            index_value = index_value.strip()
-
-                            percentage_change_element = await index_element.querySelector('p span.mu-percent')
-                            percentage_change_text = await page.evaluate('(element) => element.textContent', percentage_change_element)
-                            percentage_change_str = percentage_change_text.split('%')[0] + '%'
-                            percentage_change = percentage_change_str.strip().replace('\n', '')
-
-                            # Clean and convert data
-                            turnover_cleaned = float(turnover.replace(',', '')) if turnover else 0.0
-                            index_value_cleaned = float(index_value.replace(',', '')) if index_value else 0.0
-                            percentage_change_cleaned = float(percentage_change.replace('%', '')) if percentage_change else 0.0
-
-                            extracted_data.append({
-                                'index_name': name,
-                                'turnover': turnover_cleaned,
-                                'last_trading_index': index_value_cleaned,
-                                'percentage_change': percentage_change_cleaned,
-                                'date': updated_date
-                            })
-
-                            logger.info(f"Index Name: {name}, Turnover: {turnover_cleaned}, Last Trading Index: {index_value_cleaned}, Percentage Change: {percentage_change_cleaned}")
-                            break
-
-                        if found_matching_element:
-                            break
-
-            except Exception as e:
+                percentage_change = card['percent'].split('%')[0].strip().replace('\n', '')
+                extracted_data.append({
+                    'index_name': name,
+                    'turnover': _to_float(card['turnover']),
+                    'last_trading_index': _to_float(card['value']),
+                    'percentage_change': _to_float(percentage_change),
+                    'date': updated_date
+                })
+                row = extracted_data[-1]
+                logger.info(f"Index Name: {name}, Turnover: {row['turnover']}, Last Trading Index: {row['last_trading_index']}, Percentage Change: {row['percentage_change']}")
+            except ValueError as e:
                 logger.error(f"Error extracting data for '{name}': {e}")
 
     except Exception as e:
         logger.error(f"Error during web scraping: {e}")
 
     finally:
-        # Close the browser
-        await close_browser(browser, page)
-        logger.info("Closed the browser.")
-    
+        if browser:
+            await release_browser(browser, page)
+            logger.info("Closed the browser.")
+
     logger.info("Data Extracted, Moving to Database")
     return extracted_data
 
 
 def insert_data_into_database(final_data):
+    """
+    Maps the indices onto live_indices_price and hands them to the write-behind DB writer.
+    """
+    sql = """
+        INSERT INTO live_indices_price (index_id, last_trading_price, percentage_change, created_at, updated_at, turnover)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            last_trading_price = VALUES(last_trading_price),
+            percentage_change = VALUES(percentage_change),
+            turnover = VALUES(turnover),
+            updated_at = VALUES(updated_at)
+    """
+
+    values = []
+    for row in final_data:
+        index_id = stock_registry.sector_id(row['index_name'])
+        if index_id is not None:
+            updated_at = row['date']
+            values.append((index_id, row['last_trading_index'], row['percentage_change'], updated_at, updated_at, row['turnover']))
 
     try:
-        # Connect to the database
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE')
-        )
-        logger.info("Connection established.")
-        cursor = connection.cursor()
-
-        # Prepare the insert statement with placeholders
-        sql = """
-            INSERT INTO live_indices_price (index_id, last_trading_price, percentage_change, created_at, updated_at, turnover)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                last_trading_price = VALUES(last_trading_price),
-                percentage_change = VALUES(percentage_change),
-                turnover = VALUES(turnover),
-                updated_at = VALUES(updated_at);
-        """
-
-        # Retrieve stock symbols and their IDs
-        cursor.execute("SELECT id, index_display_name FROM sector")
-        symbols = cursor.fetchall()
-
-        index_dict = {index_name: index_id for index_id, index_name in symbols}
-
-        # Insert data into the database
-        for row in final_data:
-            indexName = row['index_name']
-            turnover = row['turnover']
-            lastTradingPrice = row['last_trading_index']
-            percentChange = row['percentage_change']
-            updated_at = row['date']
-            
-            index_id = index_dict.get(indexName)
-            if index_id is not None:
-                values = (index_id, lastTradingPrice, percentChange, updated_at, updated_at, turnover)
-                cursor.execute(sql, values)
-
-        # Commit the transaction
-        connection.commit()
-        logger.info("Data committed to the database.")
-
-    except mysql.connector.Error as err:
-        logger.error(f"Error: {err}")
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            logger.warning("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            logger.warning("Database does not exist")
-        else:
-            logger.error(err)
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-            logger.info("Closed the database connection.")
+        db_writer.submit('live_indices_price', sql, values)
+        logger.info(f"Queued {len(values)} index rows for the database writer.")
+    except Exception as e:
+        logger.error(f"Error queueing index rows for the database: {e}")
 
 
 def job():
     current_time = datetime.now().time()
     market_close_time = dt_time(15, 5)  # 3:05 PM
-    is_live = asyncio.run(scrape_market_status())
+    is_live = run_async(get_market_status())
     
     # Log current market status and time
     logger.info(f"Market live status: {'True' if is_live else 'False'}, Current time: {current_time}\n")
@@ -235,13 +170,7 @@ def job():
     if is_live or (dt_time(10, 1) <= current_time < market_close_time):
         logger.info("Starting the scraping process...")
         try:
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            extracted_data = loop.run_until_complete(scrape_website())
+            extracted_data = run_async(scrape_website())
             
             logger.info("Scraping process completed.")
             if extracted_data:
@@ -253,6 +182,8 @@ def job():
         
         except Exception as e:
             logger.error(f"An error occurred during the scraping process in Job Function: {e}")
+        finally:
+            log_query_stats(logger)
 
 
 def live_indexes():
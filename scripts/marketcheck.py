@@ -1,33 +1,59 @@
 import asyncio
+import json
 import logging
 import os
 import sys
+import time
 from pyppeteer import launch
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import acquire_browser, new_page, release_browser
+from browser.responseCapture import ResponseCapture
 
 # Configure logging
 logger = logging.getLogger()
 
+# Market status shared by every worker process through a local file
+STATE_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'state')
+MARKET_STATUS_FILE = os.path.join(STATE_DIR, 'market_status.json')
+MARKET_STATUS_LOCK = os.path.join(STATE_DIR, 'market_status.lock')
+MARKET_STATUS_TTL = int(os.getenv('MARKET_STATUS_TTL', 60))  # seconds
+MARKET_STATUS_MAX_STALE = int(os.getenv('MARKET_STATUS_MAX_STALE', 900))  # seconds a published status may serve as a fallback
+LOCK_STALE_AFTER = 300  # seconds
+
+
+def market_open_is_live(payload):
+    """
+    Reads the market-open API payload, e.g. {"isOpen": "OPEN", "asOf": "..."}.
+    """
+    return str(payload.get('isOpen', '')).strip().upper() == 'OPEN'
 
 # Main scraping function
 async def scrape_market_status(max_retries=3):
-    browser = None
-    
     for attempt in range(max_retries):
+        browser = None
         try:
-            browser = await create_browser()
-            page = await browser.newPage()
+            browser = await acquire_browser()
+            page = await new_page(browser, 'https://www.nepalstock.com.np/', logger)
+            capture = ResponseCapture(page, ['market_open'])
             
             # Set a custom user agent
             await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
             
             website = 'https://www.nepalstock.com.np/'
             
-            # Increase timeout and add additional wait time
-            await page.goto(website, {'waitUntil': 'networkidle0', 'timeout': 90000})
-            await asyncio.sleep(5)  # Wait for 5 seconds after page load
+            await page.goto(website, {'waitUntil': 'domcontentloaded', 'timeout': 90000})
+
+            # Prefer the JSON the dashboard fetches over its rendered text
+            payload = await capture.wait_for('market_open', timeout=30)
+            if payload is not None:
+                is_live = market_open_is_live(payload)
+                logger.info(f"Info about market (API): {payload}")
+                logger.info("Market Status Checked")
+                return is_live
+
+            # Fall back to the dashboard DOM
+            await asyncio.sleep(5)
 
             # Wait for the element to be visible
             await page.waitForXPath('/html/body/app-root/div/main/div/app-dashboard/div[1]/div[1]/div/div[1]/div[1]/div[2]/span[2]', {'visible': True, 'timeout': 90000})
@@ -47,11 +73,91 @@ async def scrape_market_status(max_retries=3):
         except Exception as e:
             logger.error(f"An error occurred during status checking (attempt {attempt + 1}/{max_retries}): {e}")
             if attempt == max_retries - 1:
-                return False
+                return None
             await asyncio.sleep(5)  # Wait for 5 seconds before retrying
 
         finally:
             if browser:
-                await close_browser(browser, page)
+                await release_browser(browser, page)
+
+
+def read_market_status():
+    """
+    Returns the published status as a dict with `is_live` and `checked_at`, or None.
+    """
+    try:
+        with open(MARKET_STATUS_FILE, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def publish_market_status(is_live):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    status = {'is_live': bool(is_live), 'checked_at': time.time(), 'pid': os.getpid()}
+    tmp_path = f"{MARKET_STATUS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(status, file)
+    os.replace(tmp_path, MARKET_STATUS_FILE)
+    logger.info(f"Published market status: {'Live' if is_live else 'Not Live'}")
 
+def _is_fresh(status, ttl):
+    return status is not None and time.time() - status['checked_at'] < ttl
+
+def _acquire_fetch_lock():
+    os.makedirs(STATE_DIR, exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(MARKET_STATUS_LOCK) > LOCK_STALE_AFTER:
+            os.remove(MARKET_STATUS_LOCK)
+            logger.warning("Removed stale market status lock")
+    except OSError:
+        pass
+    try:
+        os.close(os.open(MARKET_STATUS_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+def _release_fetch_lock():
+    try:
+        os.remove(MARKET_STATUS_LOCK)
+    except OSError:
+        pass
+
+async def get_market_status(ttl=MARKET_STATUS_TTL, wait=60, max_stale=MARKET_STATUS_MAX_STALE):
+    """
+    Returns whether the market is live, fetching it at most once per `ttl`
+    seconds across all processes. Only the process holding the lock opens a
+    browser; the others wait up to `wait` seconds for its result. If no fresh
+    result arrives, the last published value is used when it is at most
+    `max_stale` seconds old (0 disables the fallback). Returns None otherwise.
+    """
+    status = read_market_status()
+    if _is_fresh(status, ttl):
+        return status['is_live']
+
+    if _acquire_fetch_lock():
+        try:
+            is_live = await scrape_market_status()
+            if is_live is not None:
+                publish_market_status(is_live)
+                return is_live
+        finally:
+            _release_fetch_lock()
+    else:
+        logger.info("Market status is being fetched by another process, waiting for it")
+        started = time.time()
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(1)
+            status = read_market_status()
+            if _is_fresh(status, ttl) or (status is not None and status['checked_at'] >= started):
+                return status['is_live']
 
+    status = read_market_status()
+    if status is not None and max_stale > 0:
+        age = time.time() - status['checked_at']
+        if age <= max_stale:
+            logger.warning(f"Using last published market status from {age:.0f}s ago")
+            return status['is_live']
+        logger.warning(f"Last published market status is {age:.0f}s old, older than {max_stale}s; status unknown")
+    return None
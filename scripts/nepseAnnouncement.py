@@ -1,6 +1,8 @@
 # Import necessary libraries
 import os
+import html
 import random
+import re
 import sys
 import time
 import asyncio
@@ -18,7 +20,13 @@ import schedule
 
 # Add parent directory to system path for custom module imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import acquire_browser, new_page, release_browser, run_async
+from db.connectionPool import log_query_stats
+from db.asyncPool import async_connection, async_timed_cursor
+from db.stockRegistry import stock_registry
+from db.freshness import content_hash, crawl_times, prune, record_crawl
+from browser.tableExtractor import extract_table
+from browser.responseCapture import ResponseCapture
 from log import configure_logging
 
 # Load environment variables
@@ -28,6 +36,8 @@ load_dotenv()
 URL = "https://www.nepalstock.com.np/corporatedisclosures"
 MAX_RETRIES = 3
 RETRY_DELAY = 5
+ANNOUNCEMENT_KNOWN_RUN = int(os.getenv('ANNOUNCEMENT_KNOWN_RUN', 5))  # consecutive known rows before the scan stops
+ANNOUNCEMENT_KNOWN_DAYS = int(os.getenv('ANNOUNCEMENT_KNOWN_DAYS', 30))  # days of announcements remembered as known
 
 # Configure logging
 try:
@@ -42,98 +52,204 @@ ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
 # Function to call API for notification
-async def call_notification_api(stock_name):
+async def call_notification_api(stock_name, session=None):
     """
     Calls the notification API for a given stock name.
     """
-    async with aiohttp.ClientSession() as session:
-        url = 'https://hamrolagani.com/api/announcement/schedule-notification'
-        try:
-            async with session.post(url, ssl=ssl_context) as response:
-                if response.status == 200:
-                    logger.info(f"API call successful for {stock_name} with status {response.status}")
-                else:
-                    error_message = await response.text()
-                    logger.error(f"API call failed for {stock_name} with status {response.status}. Error message: {error_message}")
-        except aiohttp.ClientError as e:
-            logger.error(f"Error occurred while calling API for {stock_name}: {e}")
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await call_notification_api(stock_name, session)
+
+    url = 'https://hamrolagani.com/api/announcement/schedule-notification'
+    try:
+        async with session.post(url, ssl=ssl_context) as response:
+            if response.status == 200:
+                logger.info(f"API call successful for {stock_name} with status {response.status}")
+            else:
+                error_message = await response.text()
+                logger.error(f"API call failed for {stock_name} with status {response.status}. Error message: {error_message}")
+    except aiohttp.ClientError as e:
+        logger.error(f"Error occurred while calling API for {stock_name}: {e}")
 
 # Function to process and store announcement data
 async def announcement_data(data_list):
     """
     Processes and stores announcement data in the database.
+    Uses the async MySQL pool, so notification calls run while later rows are stored.
+    Not spooled: each insert depends on an existence check and triggers a
+    notification, and rows that fail are re-scraped on the next poll.
     """
     current_time = datetime.now().time()
+    loop = asyncio.get_event_loop()
+    notifications = []
 
-    try:
-        # Establish database connection
-        db_connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE')
-        )
-        cursor = db_connection.cursor()
-        logger.info("Database connection established.")
-
-        # Fetch stock data
-        cursor.execute("SELECT id, symbol FROM stock")
-        stocks = cursor.fetchall()
-        stock_ids = {symbol: stock_id for stock_id, symbol in stocks}
-        logger.info("Database stock fetched.")
-
-        current_date = datetime.now().date()
-        for row in data_list:
-            stock_name = row.get('symbol')
-            stock_id = stock_ids.get(stock_name)
-            if not stock_id:
-                logger.info(f"Stock ID for {stock_name} not found")
-                continue
+    # Resolve stock ids off the event loop: a registry miss refreshes it with a blocking query
+    symbols = {row.get('symbol') for row in data_list}
+    stock_ids = await loop.run_in_executor(None, lambda: {symbol: stock_registry.stock_id(symbol) for symbol in symbols})
 
-            # Generate random notification time
-            minute = lambda: random.randint(30, 59)
-            random_minute = minute()
-            delta = timedelta(minutes=random_minute)
-            new_time = (datetime.combine(datetime.today(), current_time) + delta).time()
-
-            # Process announcement data
-            announcement_date = datetime.strptime(row['approved_date'], "%Y-%m-%d %H:%M:%S").date()
-            announcement_text = row['announcement']
-            should_notify = announcement_date == current_date
-            notify_time = new_time if should_notify else None
-            
-            # Check if announcement already exists
-            cursor.execute(
-                "SELECT COUNT(*) FROM announcements WHERE stock_id = %s AND date = %s AND announcement = %s",
-                (stock_id, announcement_date, announcement_text)
-            )
-            exists = cursor.fetchone()[0] > 0
-            
-            # Insert new announcement if it doesn't exist
-            if not exists:
-                cursor.execute(
-                    "INSERT INTO announcements (stock_id, date, announcement, should_notify, notify_time, created_at, updated_at) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                    (stock_id, announcement_date, announcement_text, should_notify, notify_time, current_date, current_date)
-                )
-
-                db_connection.commit()
-
-                # Call notification API
-                await call_notification_api(stock_name)
-                logger.info("Notification Send")
-            
+    try:
+        async with aiohttp.ClientSession() as session:
+            try:
+                async with async_connection() as db_connection:
+                    cursor = await async_timed_cursor(db_connection)
+                    logger.info("Database connection established.")
+
+                    current_date = datetime.now().date()
+                    for row in data_list:
+                        stock_name = row.get('symbol')
+                        stock_id = stock_ids.get(stock_name)
+                        if not stock_id:
+                            logger.info(f"Stock ID for {stock_name} not found")
+                            continue
+
+                        # Generate random notification time
+                        minute = lambda: random.randint(30, 59)
+                        random_minute = minute()
+                        delta = timedelta(minutes=random_minute)
+                        new_time = (datetime.combine(datetime.today(), current_time) + delta).time()
+
+                        # Process announcement data
+                        announcement_date = datetime.strptime(row['approved_date'], "%Y-%m-%d %H:%M:%S").date()
+                        announcement_text = normalise_announcement(row['announcement'])
+                        should_notify = announcement_date == current_date
+                        notify_time = new_time if should_notify else None
+
+                        # Check if announcement already exists; rows stored before the text was
+                        # normalised (or stored as their title) are normalised for the comparison
+                        await cursor.execute(
+                            "SELECT announcement FROM announcements WHERE stock_id = %s AND date = %s",
+                            (stock_id, announcement_date)
+                        )
+                        existing = {normalise_announcement(text) for text, in await cursor.fetchall()}
+                        exists = bool(existing & announcement_texts(row))
+
+                        # Insert new announcement if it doesn't exist
+                        if not exists:
+                            await cursor.execute(
+                                "INSERT INTO announcements (stock_id, date, announcement, should_notify, notify_time, created_at, updated_at) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                                (stock_id, announcement_date, announcement_text, should_notify, notify_time, current_date, current_date)
+                            )
+
+                            await db_connection.commit()
+
+                            # Notify in the background while the next rows are stored
+                            notifications.append(asyncio.ensure_future(call_notification_api(stock_name, session)))
+
+                    await cursor.close()
+                logger.info("Database connection returned to the pool.")
+            finally:
+                if notifications:
+                    await asyncio.gather(*notifications)
+                    logger.info(f"{len(notifications)} Notifications Sent")
 
         logger.info("Announcements processed")
-    
+        return True
+
     except mysql.connector.Error as err:
         logger.error(f"Database error: {err}")
-    
-    finally:
-        if cursor:
-            cursor.close()
-        if db_connection:
-            db_connection.close()
-        logger.info("Database connection closed.")
+        return False
+
+
+def normalise_announcement(text):
+    """
+    Plain text of an announcement: tags stripped, entities decoded and
+    whitespace collapsed, so the API body and the modal text compare equal.
+    """
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', text or ''))
+    return ' '.join(text.split())
+
+
+def announcement_texts(row):
+    """
+    Texts a stored copy of `row` may have: its announcement, or its title when the body was unavailable.
+    """
+    return {text for text in (normalise_announcement(row.get('announcement')), normalise_announcement(row.get('title'))) if text}
+
+
+def announcement_key(row):
+    return (row.get('symbol') or '', (row.get('approved_date') or '')[:10], (row.get('title') or '').strip())
+
+
+async def known_announcements(days=ANNOUNCEMENT_KNOWN_DAYS):
+    """
+    Returns the (symbol, date, title) keys earlier scrapes stored, and the
+    (symbol, date, announcement) rows MySQL holds for the last `days` days.
+    """
+    loop = asyncio.get_event_loop()
+    keys = set()
+    stored = set()
+    try:
+        keys = {tuple(key.split('|', 2)) for key in await loop.run_in_executor(None, crawl_times, 'announcement')}
+    except Exception as e:
+        logger.error(f"Could not read known announcement keys: {e}")
+
+    try:
+        async with async_connection() as db_connection:
+            cursor = await async_timed_cursor(db_connection)
+            await cursor.execute(
+                "SELECT s.symbol, a.date, a.announcement FROM announcements a JOIN stock s ON s.id = a.stock_id "
+                "WHERE a.date >= CURDATE() - INTERVAL %s DAY",
+                (days,)
+            )
+            stored = {(symbol, str(date), normalise_announcement(text)) for symbol, date, text in await cursor.fetchall()}
+            await cursor.close()
+    except mysql.connector.Error as err:
+        logger.error(f"Could not load stored announcements: {err}")
+    return keys, stored
+
+
+def is_known(row, keys, stored):
+    symbol, date, title = announcement_key(row)
+    return (symbol, date, title) in keys or any((symbol, date, text) in stored for text in announcement_texts(row))
+
+
+def remember_announcements(rows, days=ANNOUNCEMENT_KNOWN_DAYS):
+    """
+    Records the keys of stored rows so later scrapes skip them without opening their modal.
+    """
+    for row in rows:
+        # Rows of unknown stocks were not stored; leave them to be retried
+        if stock_registry.stock_id(row.get('symbol')) is None:
+            continue
+        record_crawl('announcement', '|'.join(announcement_key(row)), content_hash(row.get('announcement')))
+    prune('announcement', days * 86400)
+
+
+async def store_new_announcements(rows):
+    loop = asyncio.get_event_loop()
+    if rows and await announcement_data(rows):
+        try:
+            await loop.run_in_executor(None, remember_announcements, rows)
+        except Exception as e:
+            logger.error(f"Could not record known announcement keys: {e}")
+
+
+# Function to map the disclosure API payload onto scraped rows
+def disclosure_rows(payload):
+    """
+    Maps the company disclosure API payload onto the rows scraped from the table.
+    Returns an empty list if the payload lacks a field, so the caller falls back to the DOM.
+    """
+    rows = []
+    for item in payload.get('companyNews', []):
+        symbol = item.get('symbol') or (item.get('company') or {}).get('symbol')
+        approved_date = item.get('approvedDate') or item.get('addedDate')
+        if not symbol or not approved_date:
+            return []
+        try:
+            approved_date = datetime.fromisoformat(approved_date[:19]).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return []
+
+        title = (item.get('newsHeadline') or '').strip()
+        body = normalise_announcement(item.get('newsBody'))
+        rows.append({
+            'symbol': symbol,
+            'approved_date': approved_date,
+            'title': title,
+            'announcement': body or title,
+        })
+    return rows
 
 
 # Main scraping function
@@ -146,8 +262,9 @@ async def scrape_and_process_announcements():
     
     try:
         logger.info("Launching browser")
-        browser = await create_browser()        
-        page = await browser.newPage()
+        browser = await acquire_browser()        
+        page = await new_page(browser, URL, logger)
+        capture = ResponseCapture(page, ['disclosure'])
         
         # Navigation with retry logic
         for attempt in range(MAX_RETRIES):
@@ -162,26 +279,48 @@ async def scrape_and_process_announcements():
                     raise
                 logger.error(f"Error accessing the page: {e}")
                 await asyncio.sleep(RETRY_DELAY)
+
+        keys, stored = await known_announcements()
+
+        # Prefer the JSON the page fetched, which already holds each announcement
+        payload = await capture.wait_for('disclosure', timeout=10)
+        all_data_list = disclosure_rows(payload) if payload is not None else []
+        if all_data_list:
+            new_rows = [row for row in all_data_list if not is_known(row, keys, stored)]
+            logger.info(f"Captured {len(all_data_list)} announcements from the disclosure API, {len(new_rows)} new")
+            await store_new_announcements(new_rows)
+            return
         
         # Extract headers
         await page.waitForXPath('/html/body/app-root/div/main/div/app-company-news/div[1]/div[3]/table/thead/tr', {'timeout': 30000})
-        headers_elements = await page.xpath('/html/body/app-root/div/main/div/app-company-news/div[1]/div[3]/table/thead/tr/th')
-        headers_list = [
-            (await page.evaluate('(element) => element.innerText.trim().toLowerCase().replace(/\\s+/g, "_")', header))
-            for header in headers_elements[1:5]
-        ]
+        rows_xpath = '/html/body/app-root/div/main/div/app-company-news/div[1]/div[3]/table/tbody/tr'
+        headers_list, rows_data = await extract_table(
+            page,
+            row_xpath=rows_xpath,
+            header_xpath='/html/body/app-root/div/main/div/app-company-news/div[1]/div[3]/table/thead/tr/th[position()>1 and position()<6]',
+            cell_xpath='./td[position()>1 and position()<6]'
+        )
         headers_list.append('announcement')
         logger.info(f"Headers: {headers_list}")
 
-        # Extract rows data
-        rows = await page.xpath('/html/body/app-root/div/main/div/app-company-news/div[1]/div[3]/table/tbody/tr')
+        # Row handles are still needed to open each announcement
+        rows = await page.xpath(rows_xpath)
         all_data_list = []
+        known_run = 0
+
+        for index, (row, cells) in enumerate(zip(rows, rows_data)):
+            cell_data = dict(zip(headers_list, cells))
 
-        for index, row in enumerate(rows):
+            # Newest first: after a run of stored rows the rest are older and stored too
+            if is_known(cell_data, keys, stored):
+                known_run += 1
+                if known_run >= ANNOUNCEMENT_KNOWN_RUN:
+                    logger.info(f"Reached {known_run} known announcements at row {index + 1}. Stopping scan.")
+                    break
+                continue
+            known_run = 0
             logger.info(f"Processing row {index + 1}/{len(rows)}")
-            cells = await row.xpath('.//td')
-            cell_data = {headers_list[i]: await page.evaluate('(element) => element.innerText', cell) for i, cell in enumerate(cells[1:5])}
-            
+
             # Extract announcement
             try:
                 button = await row.xpath('.//td[@class="text-left filename"]//a')
@@ -189,7 +328,7 @@ async def scrape_and_process_announcements():
                 await page.waitForXPath('//*[@id="fileView"]/div/div/div[2]/div[1]/span[2]', {'timeout': 5000})
                 announcement_element = await page.xpath('//*[@id="fileView"]/div/div/div[2]/div[1]/span[2]')
                 announcement = await page.evaluate('(element) => element.innerText', announcement_element[0])
-                cell_data['announcement'] = announcement.strip() if announcement else None
+                cell_data['announcement'] = normalise_announcement(announcement) or None
                 
                 # Close announcement modal
                 close_button = await page.xpath('//*[@id="fileView"]/div/div/div[1]/button')
@@ -206,31 +345,27 @@ async def scrape_and_process_announcements():
             all_data_list.append(cell_data)
             await asyncio.sleep(1)  # Small delay between rows
 
-        logger.info(f"Scraped {len(all_data_list)} announcements")
-        await announcement_data(all_data_list)
+        logger.info(f"Scraped {len(all_data_list)} new announcements")
+        await store_new_announcements(all_data_list)
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
         if browser:
-            await close_browser(browser, page)
+            await release_browser(browser, page)
 
 # Job function to be scheduled
 def job():
     logger.info("Starting the scraping process...")
     try:
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        loop.run_until_complete(scrape_and_process_announcements())
+        run_async(scrape_and_process_announcements())
         
         logger.info("Scraping process completed.")
     
     except Exception as e:
         logger.error(f"An error occurred during the scraping process in Job Function: {e}")
+    finally:
+        log_query_stats(logger)
 
 # Main function to run the live indexes
 def announcements():
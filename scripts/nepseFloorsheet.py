@@ -1,6 +1,10 @@
+import argparse
 import asyncio
-from datetime import datetime
+import csv
+from datetime import datetime, time as dt_time
 import os
+import tempfile
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 import sys
 import time
 from pyppeteer.errors import TimeoutError
@@ -11,7 +15,14 @@ import schedule
 
 # Set up logging
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import acquire_browser, new_page, release_browser, report_page_metrics, run_async
+from db.connectionPool import checkout_connection, has_unique_key, log_query_stats, release_connection, timed_cursor
+from db.stockRegistry import stock_registry
+from db.spool import write_through
+from db.checkpoint import add_resume_arguments, clear_checkpoint, load_checkpoint, save_checkpoint
+from browser.tableExtractor import extract_table
+from browser.responseCapture import ResponseCapture
+from scripts.marketcheck import get_market_status
 
 from log import configure_logging
 
@@ -27,18 +38,206 @@ load_dotenv()
 
 url = "https://www.nepalstock.com.np/floor-sheet"
 
-async def scrapy_extraction():
+FLOORSHEET_QUEUE_PAGES = int(os.getenv('FLOORSHEET_QUEUE_PAGES', 4))  # scraped pages waiting to be inserted
+FLOORSHEET_BATCH_SIZE = int(os.getenv('FLOORSHEET_BATCH_SIZE', 1000))  # rows per upsert executemany
+FLOORSHEET_LOAD_INFILE = os.getenv('FLOORSHEET_LOAD_INFILE', '0') == '1'  # also set MYSQL_ALLOW_LOCAL_INFILE=1
+FLOORSHEET_TABS = int(os.getenv('FLOORSHEET_TABS', 4))  # tabs fetching pages concurrently; 1 clicks through pages serially
+FLOORSHEET_INTRADAY = os.getenv('FLOORSHEET_INTRADAY', '1') == '1'
+FLOORSHEET_POLL_MINUTES = int(os.getenv('FLOORSHEET_POLL_MINUTES', 5))
+
+
+# Replays a captured API request from inside the page, so the site's origin and cookies apply
+FETCH_JSON_JS = '''
+async (url, method, headers, body) => {
+    const response = await fetch(url, {method: method, headers: headers, body: body || undefined, credentials: 'include'});
+    if (!response.ok) {
+        return {status: response.status, payload: null};
+    }
+    return {status: response.status, payload: await response.json()};
+}
+'''
+
+
+def floorsheet_rows(payload, current_date):
+    """
+    Maps a floorsheet API page onto the positional rows scraped from the table:
+    transaction_no, symbol, buyer, seller, quantity, rate, amount, date.
+    """
+    rows = []
+    for item in payload.get('floorsheets', {}).get('content', []):
+        rows.append([
+            str(item.get('contractId')),
+            str(item.get('stockSymbol')),
+            str(item.get('buyerMemberId')),
+            str(item.get('sellerMemberId')),
+            str(item.get('contractQuantity')),
+            str(item.get('contractRate')),
+            str(item.get('contractAmount')),
+            str(item.get('businessDate') or current_date),
+        ])
+    return rows
+
+
+def _is_newer(row, since):
+    try:
+        return int(row[0]) > since
+    except ValueError:
+        return True
+
+
+def can_shard(request, payload):
+    """
+    Pages can be fetched directly when the captured API request is paged by a `page` parameter.
+    """
+    if request is None or payload is None or not payload.get('floorsheets', {}).get('totalPages'):
+        return False
+    return 'page' in parse_qs(urlsplit(request['url']).query)
+
+
+def page_url(request_url, number):
+    parts = urlsplit(request_url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query['page'] = [str(number)]
+    return urlunsplit(parts._replace(query=urlencode(query, doseq=True)))
+
+
+async def fetch_floorsheet_page(tab, request, number, retries=3):
+    """
+    Replays the captured floorsheet request for page `number` inside `tab`. Returns the payload or None.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            result = await tab.evaluate(FETCH_JSON_JS, page_url(request['url'], number),
+                                        request['method'], request['headers'], request['body'])
+            if result['payload'] is not None:
+                return result['payload']
+            logger.warning(f"Floorsheet page {number} returned status {result['status']} (attempt {attempt}/{retries})")
+        except Exception as e:
+            logger.warning(f"Error fetching floorsheet page {number} (attempt {attempt}/{retries}): {e}")
+        await asyncio.sleep(attempt)
+    return None
+
+
+def _contract_order(row):
+    try:
+        return int(row[0])
+    except ValueError:
+        return -1
+
+
+def _resume_page(resume, floorsheets):
+    """
+    Returns the page a checkpointed crawl stopped at, or None if the
+    floorsheet has changed since and the pages no longer line up.
+    """
+    if not resume:
+        return None
+    if resume.get('total') != floorsheets.get('totalElements') or resume.get('total_pages') != floorsheets['totalPages']:
+        logger.warning(f"Floorsheet changed since the checkpoint ({resume.get('total')} -> "
+                       f"{floorsheets.get('totalElements')} contracts), crawling from the first page")
+        return None
+    if resume['page'] <= floorsheets.get('number', 0):
+        return None
+    return resume['page']
+
+
+async def sharded_pages(browser, page, request, first_payload, current_date, summary=None, resume=None):
+    """
+    Fetches the remaining floorsheet pages across FLOORSHEET_TABS tabs and
+    yields them newest contract first, deduplicated on transaction_no.
+
+    Tab i takes every K-th page, so each wave of K concurrent fetches covers a
+    contiguous run of contracts and the waves can be yielded in order.
+    `summary['checkpoint']` tracks the first page not yet yielded in full, so
+    a crawl restarted with that checkpoint as `resume` skips the pages before it.
+    """
+    summary = {} if summary is None else summary
+    floorsheets = first_payload['floorsheets']
+    total_pages = floorsheets['totalPages']
+    summary.setdefault('total', floorsheets.get('totalElements'))
+
+    payloads = [first_payload]
+    start_page = _resume_page(resume, floorsheets)
+    if start_page is not None:
+        logger.info(f"Resuming floorsheet crawl from page {start_page} of {total_pages}")
+        payloads = []
+    else:
+        start_page = floorsheets.get('number', 0) + 1
+    numbers = list(range(start_page, total_pages))
+    checkpoint = {'run': str(current_date), 'total': floorsheets.get('totalElements'), 'total_pages': total_pages}
+
+    seen = set()
+    failed_pages = []
+    extra_tabs = []
+    try:
+        extra_tabs = [await new_page(browser, url, logger) for _ in range(min(FLOORSHEET_TABS, len(numbers)) - 1)]
+        loaded = await asyncio.gather(*(tab.goto(url) for tab in extra_tabs), return_exceptions=True)
+        for result in loaded:
+            if isinstance(result, Exception):
+                logger.error(f"Error loading floorsheet tab, continuing with fewer tabs: {result}")
+        tabs = [page] + [tab for tab, result in zip(extra_tabs, loaded) if not isinstance(result, Exception)]
+        logger.info(f"Fetching {len(numbers)} more floorsheet pages of {total_pages} across {len(tabs)} tabs")
+
+        wave_start = 0
+        while True:
+            rows = []
+            for payload in payloads:
+                for row in floorsheet_rows(payload, current_date):
+                    if row[0] not in seen:
+                        seen.add(row[0])
+                        rows.append(row)
+            rows.sort(key=_contract_order, reverse=True)
+            # Once the last chunk is stored every page before the next wave is done, except failed ones
+            next_page = numbers[wave_start] if wave_start < len(numbers) else total_pages
+            for start in range(0, len(rows), 500):
+                if start + 500 >= len(rows):
+                    summary['checkpoint'] = dict(checkpoint, page=min(failed_pages + [next_page]))
+                yield rows[start:start + 500]
+
+            wave = numbers[wave_start:wave_start + len(tabs)]
+            if not wave:
+                break
+            wave_start += len(wave)
+            results = await asyncio.gather(*(fetch_floorsheet_page(tab, request, number) for tab, number in zip(tabs, wave)))
+            failed_pages.extend(number for number, payload in zip(wave, results) if payload is None)
+            payloads = [payload for payload in results if payload is not None]
+            logger.info(f"Fetched floorsheet pages {wave[0]}-{wave[-1]} of {total_pages}")
+
+        if failed_pages:
+            logger.error(f"Could not fetch floorsheet pages {failed_pages}")
+        else:
+            summary['complete'] = True
+    finally:
+        for tab in extra_tabs:
+            report_page_metrics(tab)
+            try:
+                await tab.close()
+            except Exception as e:
+                logger.error(f"Error closing floorsheet tab: {e}")
+
+
+async def scrapy_extraction(since=None, summary=None, resume=None):
+    """
+    Async generator yielding the floorsheet one table page (up to 500 rows) at a time.
+
+    The floorsheet lists the newest contracts first, so with `since` set only
+    rows with a higher transaction_no are yielded and paging stops at the
+    first page that reaches the checkpoint. `summary['total']` receives the
+    contract count the site reports for the day, when it is known. A full
+    crawl fetched by page skips the pages a `resume` checkpoint has stored.
+    """
     browser = None
     page = None
-    all_data = []
+    total_rows = 0
     try:
         try:
-            logger.info("Creating browser instance...")
-            browser = await create_browser()
-            page = await browser.newPage()
+            logger.info("Leasing browser instance from the pool...")
+            browser = await acquire_browser()
+            page = await new_page(browser, url, logger)
+            capture = ResponseCapture(page, ['floorsheet'])
         except Exception as e:
             logger.error(f"An error occurred while creating browser instance: {e}")
-            return all_data
+            return
 
         try:
             logger.info(f"Navigating to {url}...")
@@ -46,44 +245,31 @@ async def scrapy_extraction():
             await asyncio.sleep(2)
         except TimeoutError:
             logger.error("Timeout while navigating to the URL.")
-            return all_data
+            return
         except Exception as e:
             logger.error(f"An error occurred while navigating to the URL: {e}")
-            return all_data
+            return
 
         try:
             logger.info("Extracting headers...")
-            headers_xpath = '/html/body/app-root/div/main/div/app-floor-sheet/div/div[4]/table/thead/tr/th'
-            headers_elements = await page.xpath(headers_xpath)
+            headers_xpath = '/html/body/app-root/div/main/div/app-floor-sheet/div/div[4]/table/thead/tr/th[position()>1]'  # Skip the first column (serial number)
+            headers, _ = await extract_table(page, header_xpath=headers_xpath, header_replacements=[
+                ('(rs)', ''),
+                ('contract no.', 'transaction_no'),
+                ('stock symbol', 'symbol'),
+                ('buyer.', 'buyer_broker_id'),
+                ('seller.', 'sell_broker_id'),
+                ('quantity.', 'share_quantity'),
+            ])
+            headers.append('date')  # Add date column to headers
+            logger.info(f"Headers extracted: {headers}")
             await asyncio.sleep(2)
         except TimeoutError:
             logger.error("Timeout while extracting headers.")
-            return all_data
+            return
         except Exception as e:
             logger.error(f"An error occurred while extracting headers: {e}")
-            return all_data
-
-        headers = []
-        try:
-            for i, element in enumerate(headers_elements):
-                if i == 0:  # Skip the first column (serial number)
-                    continue
-                header_text = await page.evaluate('(element) => element.innerText', element)
-                header_text = header_text.strip().lower().replace(' ', '_').replace('(rs)', '')
-                header_text = header_text.replace('contract_no.', 'transaction_no')
-                header_text = header_text.replace('stock_symbol', 'symbol')
-                header_text = header_text.replace('buyer.', 'buyer_broker_id')
-                header_text = header_text.replace('seller.', 'sell_broker_id')
-                header_text = header_text.replace('quantity.', 'share_quantity')
-                header_text = header_text.replace('rate_', 'rate')
-                header_text = header_text.replace('amount_', 'amount')
-                headers.append(header_text)
-            headers.append('date')  # Add date column to headers
-            logger.info(f"Headers extracted: {headers}")
-            await asyncio.sleep(2)
-        except Exception as e:
-            logger.error(f"An error occurred while processing headers: {e}")
-            return all_data
+            return
 
         try:
             logger.info("Selecting 500 entries per page...")
@@ -94,168 +280,512 @@ async def scrapy_extraction():
             await asyncio.sleep(2)  # Wait for the change to take effect
         except TimeoutError:
             logger.error("Timeout while selecting the number of entries per page.")
-            return all_data
+            return
         except Exception as e:
             logger.error(f"An error occurred while selecting the number of entries per page: {e}")
-            return all_data
+            return
 
         try:
             logger.info("Clicking the filter button...")
             filter_button_xpath = '/html/body/app-root/div/main/div/app-floor-sheet/div/div[3]/div/div[6]/button[1]'
             filter_button = await page.waitForXPath(filter_button_xpath)
+            capture.clear('floorsheet')
             await page.evaluate('(element) => element.click()', filter_button)
-            await asyncio.sleep(2)
+            if await capture.wait_for('floorsheet', timeout=10) is None:
+                await asyncio.sleep(2)
         except TimeoutError:
             logger.error("Timeout while clicking the filter button.")
-            return all_data
+            return
         except Exception as e:
             logger.error(f"An error occurred while clicking the filter button: {e}")
-            return all_data
+            return
 
         page_num = 1
         current_date = datetime.now().date()
 
+        request = capture.last_request('floorsheet')
+        payload = capture.latest('floorsheet')
+        if since is None and FLOORSHEET_TABS > 1 and can_shard(request, payload):
+            try:
+                async for rows in sharded_pages(browser, page, request, payload, current_date, summary, resume):
+                    total_rows += len(rows)
+                    yield rows
+                logger.info(f"Total extracted rows: {total_rows}")
+            except Exception as e:
+                logger.error(f"An error occurred while fetching floorsheet shards: {e}")
+            return
+
         try:
             while True:
                 logger.info(f"Extracting data from page {page_num}...")
-                rows_xpath = '/html/body/app-root/div/main/div/app-floor-sheet/div/div[4]/table/tbody/tr'
-                rows_elements = await page.xpath(rows_xpath)
-
-                for row in rows_elements:
-                    cells = await row.xpath('./td')
-                    row_data = []
-                    for i, cell in enumerate(cells):
-                        if i == 0:  # Skip the first column (serial number)
-                            continue
-                        cell_text = await page.evaluate('(element) => element.innerText', cell)
-                        cell_text = cell_text.replace(',', '').strip() 
-                        row_data.append(cell_text)
-                    row_data.append(str(current_date))  
-                    all_data.append(row_data)
-
-                logger.info(f"Extracted {len(rows_elements)} rows from page {page_num}")
+                # Use the JSON page the table was rendered from, else read the table
+                payload = capture.latest('floorsheet')
+                if payload is not None:
+                    rows = floorsheet_rows(payload, current_date)
+                else:
+                    rows_xpath = '/html/body/app-root/div/main/div/app-floor-sheet/div/div[4]/table/tbody/tr'
+                    _, cells = await extract_table(page, row_xpath=rows_xpath, cell_xpath='./td[position()>1]')  # Skip the first column (serial number)
+                    rows = [[cell.replace(',', '') for cell in row] + [str(current_date)] for row in cells]
+
+                if summary is not None and payload is not None:
+                    summary.setdefault('total', payload.get('floorsheets', {}).get('totalElements'))
+
+                reached_checkpoint = False
+                if since is not None:
+                    new_rows = [row for row in rows if _is_newer(row, since)]
+                    reached_checkpoint = len(new_rows) < len(rows)
+                    rows = new_rows
+
+                logger.info(f"Extracted {len(rows)} rows from page {page_num}")
+                total_rows += len(rows)
+                if rows:
+                    yield rows
+
+                if reached_checkpoint:
+                    logger.info(f"Reached checkpoint transaction {since}. Stopping extraction.")
+                    break
+
+                if payload is not None and payload.get('floorsheets', {}).get('last'):
+                    logger.info("Reached the last page. Stopping extraction.")
+                    break
 
                 # Check if next button is disabled
                 next_button = await page.xpath('/html/body/app-root/div/main/div/app-floor-sheet/div/div[5]/div[2]/pagination-controls/pagination-template/ul/li[10]')
                 if next_button:
                     class_property = await next_button[0].getProperty('className')
-                    await page.waitFor(2000)
+                    if payload is None:
+                        await page.waitFor(2000)
                     class_value = await class_property.jsonValue()
-                    print(class_value)
                     if "disabled" in class_value:
                         logger.info("Reached the last page. Stopping extraction.")
                         break
                     
                     logger.info("Clicking next page button...")
+                    capture.clear('floorsheet')
                     await next_button[0].click()
-                    await asyncio.sleep(2)
+                    if await capture.wait_for('floorsheet', timeout=10) is None:
+                        await asyncio.sleep(2)
                     page_num += 1
                 else:
                     logger.info("Next button not found. Stopping extraction.")
                     break
 
-            logger.info(f"Total extracted rows: {len(all_data)}")
+            logger.info(f"Total extracted rows: {total_rows}")
         except TimeoutError:
             logger.error("Timeout while extracting data.")
-            return all_data
+            return
         except Exception as e:
             logger.error(f"An error occurred while extracting data: {e}")
-            return all_data
-
-        return all_data
+            return
     finally:
         if browser:
             logger.info("Closing the browser...")
-            await close_browser(browser, page)
+            await release_browser(browser, page)
+
+FLOORSHEET_COLUMNS = ('stock_id', 'transaction_no', 'buyer_broker_id', 'sell_broker_id', 'share_quantity',
+                      'rate', 'amount', 'date', 'created_at', 'updated_at')
+
+# Re-running a day overwrites contracts already stored, keeping their id and
+# created_at; needs a unique key on floorsheet.transaction_no (see
+# floorsheet_upsert_supported)
+FLOORSHEET_ON_DUPLICATE_SQL = """
+    ON DUPLICATE KEY UPDATE
+        stock_id = VALUES(stock_id),
+        buyer_broker_id = VALUES(buyer_broker_id),
+        sell_broker_id = VALUES(sell_broker_id),
+        share_quantity = VALUES(share_quantity),
+        rate = VALUES(rate),
+        amount = VALUES(amount),
+        date = VALUES(date),
+        updated_at = VALUES(updated_at)
+"""
+
+UPSERT_FLOORSHEET_SQL = f"""
+    INSERT INTO floorsheet ({', '.join(FLOORSHEET_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(FLOORSHEET_COLUMNS))})
+    {FLOORSHEET_ON_DUPLICATE_SQL}
+"""
+
+# LOAD DATA has no ON DUPLICATE KEY UPDATE (REPLACE would delete and re-insert
+# conflicting rows), so the file goes into a per-connection staging table first
+CREATE_FLOORSHEET_STAGING_SQL = f"""
+    CREATE TEMPORARY TABLE IF NOT EXISTS floorsheet_load
+    SELECT {', '.join(FLOORSHEET_COLUMNS)} FROM floorsheet LIMIT 0
+"""
+
+LOAD_FLOORSHEET_SQL = f"""
+    LOAD DATA LOCAL INFILE %s
+    INTO TABLE floorsheet_load
+    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+    LINES TERMINATED BY '\\n'
+    ({', '.join(FLOORSHEET_COLUMNS)})
+"""
+
+MERGE_FLOORSHEET_SQL = f"""
+    INSERT INTO floorsheet ({', '.join(FLOORSHEET_COLUMNS)})
+    SELECT {', '.join(FLOORSHEET_COLUMNS)} FROM floorsheet_load
+    {FLOORSHEET_ON_DUPLICATE_SQL}
+"""
+
+
+ADD_FLOORSHEET_KEY_SQL = "ALTER TABLE floorsheet ADD UNIQUE KEY floorsheet_transaction_no_unique (transaction_no)"
+
+_floorsheet_upsert_supported = None
+
+
+def floorsheet_upsert_supported():
+    """
+    Checks once per process that floorsheet has the unique key on
+    transaction_no the upserts rely on; without it every re-run of a day
+    would insert its contracts again.
+    """
+    global _floorsheet_upsert_supported
+    if _floorsheet_upsert_supported is None:
+        _floorsheet_upsert_supported = has_unique_key('floorsheet', 'transaction_no')
+        if not _floorsheet_upsert_supported:
+            logger.warning(f"floorsheet has no unique key on transaction_no, using update/insert instead of the upsert. "
+                           f"Add it with: {ADD_FLOORSHEET_KEY_SQL}")
+    return _floorsheet_upsert_supported
+
+
+def update_or_insert_floorsheet(values):
+    """
+    Fallback without the unique key: updates the contracts already stored and
+    inserts the rest, in one transaction. Not spooled, since a replay could
+    not tell a half-applied batch from a new one. Returns True once committed.
+    """
+    connection = None
+    cursor = None
+    try:
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        existing = set()
+        for start in range(0, len(values), FLOORSHEET_BATCH_SIZE):
+            transaction_nos = [row[1] for row in values[start:start + FLOORSHEET_BATCH_SIZE]]
+            cursor.execute(
+                f"SELECT DISTINCT transaction_no FROM floorsheet WHERE transaction_no IN ({', '.join(['%s'] * len(transaction_nos))})",
+                transaction_nos
+            )
+            existing.update(str(transaction_no) for transaction_no, in cursor.fetchall())
+
+        updated_columns = [column for column in FLOORSHEET_COLUMNS if column not in ('transaction_no', 'created_at')]
+        updates = [tuple(row[FLOORSHEET_COLUMNS.index(column)] for column in updated_columns) + (row[1],)
+                   for row in values if str(row[1]) in existing]
+        inserts = [row for row in values if str(row[1]) not in existing]
+        for start in range(0, len(updates), FLOORSHEET_BATCH_SIZE):
+            cursor.executemany(
+                f"UPDATE floorsheet SET {', '.join(f'{column} = %s' for column in updated_columns)} WHERE transaction_no = %s",
+                updates[start:start + FLOORSHEET_BATCH_SIZE]
+            )
+        for start in range(0, len(inserts), FLOORSHEET_BATCH_SIZE):
+            cursor.executemany(
+                f"INSERT INTO floorsheet ({', '.join(FLOORSHEET_COLUMNS)}) VALUES ({', '.join(['%s'] * len(FLOORSHEET_COLUMNS))})",
+                inserts[start:start + FLOORSHEET_BATCH_SIZE]
+            )
+        connection.commit()
+        return True
+    except mysql.connector.Error as err:
+        logger.error(f"Floorsheet update/insert failed: {err}")
+        return False
+    finally:
+        release_connection(connection, cursor)
+
+
+def floorsheet_values(final_data, skipped=None):
+    """
+    Converts scraped rows into FLOORSHEET_COLUMNS tuples, skipping unknown stocks and malformed rows.
+    The (date, transaction_no) of each skipped row is added to `skipped`.
+    """
+    current_datetime = datetime.now(pytz.timezone('Asia/Kathmandu')).strftime('%Y-%m-%d %H:%M:%S')
+    values = []
+    missing = set()
+    skipped = set() if skipped is None else skipped
+    for row in final_data:
+        stock_id = stock_registry.stock_id(row[1])
+        if stock_id is None:
+            missing.add(row[1])
+            skipped.add((row[7], row[0]))
+            continue
+        try:
+            values.append((
+                stock_id,
+                row[0],
+                int(row[2]),
+                int(row[3]),
+                float(row[4].replace(",", "")),
+                float(row[5].replace(",", "")),
+                float(row[6].replace(",", "")),
+                row[7],
+                current_datetime,
+                current_datetime
+            ))
+        except ValueError as error:
+            logger.error(f"Skipping malformed floorsheet row {row}: {error}")
+            skipped.add((row[7], row[0]))
+
+    if missing:
+        logger.warning(f"Skipping rows for {len(missing)} unknown stocks: {sorted(missing)}")
+    return values
+
+
+def load_floorsheet(cursor, values):
+    """
+    Writes the rows to a temporary CSV, loads it into the floorsheet_load
+    staging table with LOAD DATA LOCAL INFILE and merges it into floorsheet
+    with the same ON DUPLICATE KEY UPDATE as the batched upsert.
+    """
+    with tempfile.NamedTemporaryFile('w', newline='', suffix='.csv', delete=False) as csv_file:
+        csv.writer(csv_file, lineterminator='\n').writerows(values)
+    try:
+        cursor.execute(CREATE_FLOORSHEET_STAGING_SQL)
+        cursor.execute("DELETE FROM floorsheet_load")
+        cursor.execute(LOAD_FLOORSHEET_SQL, (csv_file.name.replace('\\', '/'),))
+        cursor.execute(MERGE_FLOORSHEET_SQL)
+        cursor.execute("DELETE FROM floorsheet_load")
+    finally:
+        os.remove(csv_file.name)
 
-def insert_data_to_database(final_data):
-    logger.info("Connecting to the database...")
-    
+
+def load_infile(values):
+    """
+    LOAD DATA fast path on its own connection. Returns True once committed.
+    """
     connection = None
     cursor = None
-    
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE')
-        )
-        logger.info("Database connection established.")
-        
-        cursor = connection.cursor(dictionary=True)
-        current_datetime = datetime.now(pytz.timezone('Asia/Kathmandu')).strftime('%Y-%m-%d %H:%M:%S')
-        
-        cursor.execute('SELECT * FROM stock')
-        stock_rows = cursor.fetchall()
-
-        logger.info("Inserting/updating Floorsheet Data")
-        if stock_rows:
-            for row in final_data:
-                stock = next((stock for stock in stock_rows if stock['symbol'] == row[1]), None)
-                
-                if stock:
-                    stock_id = stock['id']
-                    buyer_broker_id = int(row[2])
-                    sell_broker_id = int(row[3])
-                    share_quantity = float(row[4].replace(",", ""))
-                    rate = float(row[5].replace(",", ""))
-                    amount = float(row[6].replace(",", ""))
-                    traded_date = row[7]
-                    
-                    sql_live_floorsheet = """
-                        INSERT INTO floorsheet (stock_id, transaction_no, buyer_broker_id, sell_broker_id, share_quantity, rate, amount, date, created_at, updated_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    try:
-                        cursor.execute(sql_live_floorsheet, (
-                            stock_id,
-                            row[0],
-                            buyer_broker_id,
-                            sell_broker_id,
-                            share_quantity,
-                            rate,
-                            amount,
-                            traded_date,
-                            current_datetime,
-                            current_datetime
-                        ))
-                    except Exception as error:
-                        logger.error(f'Error during Floorsheet Data Insertion: {error}')
-                else:
-                    logger.warning(f"Skipping row due to missing stock: {row}")
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        load_floorsheet(cursor, values)
+        connection.commit()
+        return True
+    except mysql.connector.Error as error:
+        logger.warning(f"LOAD DATA LOCAL INFILE failed, falling back to batched upsert: {error}")
+        return False
+    finally:
+        release_connection(connection, cursor)
+
+
+def skipped_contracts(traded_date):
+    """
+    Transaction numbers of `traded_date` that were scraped but not stored
+    (funds, debentures and other stocks missing from the registry).
+    """
+    checkpoint = load_checkpoint('floorsheet_skipped', run=str(traded_date))
+    return set(checkpoint['contracts']) if checkpoint else set()
+
+
+def record_skipped(skipped):
+    """
+    Adds (date, transaction_no) pairs to the per-day skipped contracts, so
+    reconciliation can tell them apart from contracts that are missing.
+    """
+    by_date = {}
+    for traded_date, transaction_no in skipped:
+        by_date.setdefault(str(traded_date), set()).add(transaction_no)
+    for traded_date, contracts in by_date.items():
+        known = skipped_contracts(traded_date)
+        if not contracts - known:
+            continue
+        try:
+            save_checkpoint('floorsheet_skipped', {'run': traded_date, 'contracts': sorted(known | contracts)})
+        except OSError as e:
+            logger.error(f"Could not record skipped floorsheet contracts: {e}")
 
-            connection.commit()  # Ensure the transaction is committed
-            logger.info("Floorsheet Data Inserted.")
+
+def insert_data_to_database(final_data):
+    """
+    Upserts one page of floorsheet rows keyed on transaction_no and commits it,
+    or updates/inserts them when the table lacks that key. Rows MySQL does not
+    accept stay in the local spool for replay. Returns the number of rows
+    written (0 if they were spooled), or None if the page was not stored.
+    """
+    inserted = None
+
+    try:
+        skipped = set()
+        values = floorsheet_values(final_data, skipped)
+        if skipped:
+            record_skipped(skipped)
+        if not values:
+            return 0
+
+        if not floorsheet_upsert_supported():
+            if update_or_insert_floorsheet(values):
+                inserted = len(values)
+        elif FLOORSHEET_LOAD_INFILE and load_infile(values):
+            inserted = len(values)
+        elif write_through('floorsheet', UPSERT_FLOORSHEET_SQL, values, FLOORSHEET_BATCH_SIZE):
+            inserted = len(values)
         else:
-            logger.warning("No stock or broker data found")
+            inserted = 0
 
     except Exception as e:
-        logger.error(f"Connection to database failed: {e}")
+        logger.error(f"Error during Floorsheet Data Insertion: {e}")
+
+    return inserted
+
+
+async def produce_pages(queue, since=None, summary=None, resume=None, failed=None):
+    summary = {} if summary is None else summary
+    pages = scrapy_extraction(since, summary, resume)
+    try:
+        async for rows in pages:
+            if failed is not None and failed.is_set():
+                logger.error("Stopping the floorsheet crawl: a page could not be stored")
+                break
+            # The checkpoint a page carries holds once that page is committed
+            await queue.put((rows, summary.get('checkpoint')))
+    finally:
+        await pages.aclose()
+        await queue.put(None)
+
+
+async def consume_pages(queue, failed):
+    """
+    Inserts each queued page as it arrives; the blocking DB call runs in a
+    worker thread. The checkpoint only moves past pages that were committed
+    or spooled. Once a page is lost, `failed` is set and the remaining
+    queued pages are drained without being stored.
+    """
+    loop = asyncio.get_event_loop()
+    pages = 0
+    inserted = 0
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        if failed.is_set():
+            continue
+        rows, checkpoint = item
+        pages += 1
+        stored = await loop.run_in_executor(None, insert_data_to_database, rows)
+        if stored is None:
+            logger.error(f"Floorsheet page {pages} was not stored, keeping the checkpoint before it")
+            failed.set()
+            continue
+        inserted += stored
+        logger.info(f"Committed page {pages}: {inserted} floorsheet rows so far")
+        if checkpoint is not None:
+            try:
+                save_checkpoint('floorsheet', checkpoint)
+            except OSError as e:
+                logger.error(f"Could not save floorsheet checkpoint: {e}")
+    return inserted
+
+
+async def stream_floorsheet(since=None, summary=None, resume=False):
+    """
+    Scrapes and stores the floorsheet page by page, so memory stays flat and
+    every committed page survives a failure later in the crawl. A full crawl
+    (no `since`) checkpoints its progress and, with `resume`, continues from
+    where an interrupted crawl of the same day stopped. The crawl stops at
+    the first page that could not be stored and sets summary['failed'].
+    """
+    summary = {} if summary is None else summary
+    checkpoint = None
+    if since is None:
+        if resume:
+            checkpoint = load_checkpoint('floorsheet', run=str(datetime.now().date()))
+        else:
+            clear_checkpoint('floorsheet')
 
+    queue = asyncio.Queue(maxsize=FLOORSHEET_QUEUE_PAGES)
+    failed = asyncio.Event()
+    consumer = asyncio.ensure_future(consume_pages(queue, failed))
+    try:
+        await produce_pages(queue, since, summary, checkpoint, failed)
+    finally:
+        inserted = await consumer
+    if failed.is_set():
+        summary['failed'] = True
+    elif summary.get('complete'):
+        clear_checkpoint('floorsheet')
+    logger.info(f"Floorsheet Data Inserted: {inserted} rows.")
+    return inserted
+
+
+def floorsheet_checkpoint(traded_date):
+    """
+    Returns (highest transaction_no, row count) stored for `traded_date`; the
+    transaction_no is None when nothing is stored yet.
+    """
+    connection = None
+    cursor = None
+    try:
+        connection = checkout_connection()
+        cursor = timed_cursor(connection)
+        cursor.execute(
+            "SELECT MAX(CAST(transaction_no AS UNSIGNED)), COUNT(*) FROM floorsheet WHERE date = %s",
+            (str(traded_date),)
+        )
+        last_transaction, stored = cursor.fetchone()
+        return (int(last_transaction) if last_transaction is not None else None), stored
     finally:
-        if cursor is not None:
-            cursor.close()
-        if connection is not None and connection.is_connected():
-            connection.close()
-            logger.info("Database connection closed.")
+        release_connection(connection, cursor)
 
 
-def job():
+def intraday_job():
+    """
+    Polls the floorsheet while the market is live and stores only the
+    contracts newer than the last one already in the database.
+    """
+    current_time = datetime.now().time()
+    if not (dt_time(11, 0) <= current_time <= dt_time(15, 5)):
+        return
+    try:
+        if not run_async(get_market_status()):
+            return
+        checkpoint, stored = floorsheet_checkpoint(datetime.now().date())
+        logger.info(f"Intraday floorsheet poll from transaction {checkpoint} ({stored} rows stored today)")
+        run_async(stream_floorsheet(since=checkpoint))
+    except Exception as e:
+        logger.error(f"Error while running intraday floorsheet poll: {e}")
+    finally:
+        log_query_stats(logger)
+
+
+def job(resume=True):
+    """
+    End-of-day reconciliation: fetches whatever arrived after the last
+    intraday poll, then re-crawls the whole day only if the stored row count
+    is still short of the count the site reports. With nothing stored yet
+    this is a full crawl. With `resume`, a full crawl interrupted earlier
+    today continues from its checkpoint.
+    """
     try:
         logger.info("Running Job func")
-        loop = asyncio.get_event_loop()
-        data = loop.run_until_complete(scrapy_extraction())
-        insert_data_to_database(data)
-    except:
-        logger.error("Error While running Job Function")
+        today = datetime.now().date()
+        checkpoint, _ = floorsheet_checkpoint(today)
+        summary = {}
+        run_async(stream_floorsheet(since=checkpoint, summary=summary, resume=resume))
+        if summary.get('failed'):
+            logger.error(f"Floorsheet for {today} not reconciled: storing a page failed, the next run continues from what was stored")
+            return
+
+        _, stored = floorsheet_checkpoint(today)
+        expected = summary.get('total')
+        if expected is not None:
+            # Contracts of stocks outside the registry are never stored
+            expected -= len(skipped_contracts(today))
+        if checkpoint is not None and expected is not None and stored < expected:
+            logger.warning(f"Floorsheet has {stored} of {expected} storable contracts for {today}, re-crawling the full day")
+            run_async(stream_floorsheet(resume=resume))
+        else:
+            logger.info(f"Floorsheet reconciled: {stored} contracts stored, {expected} storable reported for {today}")
+    except Exception as e:
+        logger.error(f"Error While running Job Function: {e}")
+    finally:
+        log_query_stats(logger)
 
-def dailyFloorsheet():
+def dailyFloorsheet(resume=True):
     while True:
         try:
             logger.info("Initializing schedule_jobs...")
-            # Schedule the job to run at 11:20 AM every day
-            schedule.every().day.at("15:30").do(job)
+            schedule.clear()
+            if FLOORSHEET_INTRADAY:
+                schedule.every(FLOORSHEET_POLL_MINUTES).minutes.do(intraday_job)
+            # Reconcile the day's floorsheet after close
+            schedule.every().day.at("15:30").do(job, resume=resume)
             logger.info("Job scheduled successfully.")
 
             while True:
@@ -274,5 +804,6 @@ def dailyFloorsheet():
             
 
 if __name__ == "__main__":
-    job()
+    args = add_resume_arguments(argparse.ArgumentParser(description="Floorsheet reconciliation crawl")).parse_args()
+    job(resume=args.resume)
 
@@ -1,4 +1,3 @@
-import asyncio
 import os
 import logging
 from datetime import datetime, time 
@@ -6,13 +5,14 @@ import sys
 from dotenv import load_dotenv
 import psutil
 from pyppeteer import launch
-import mysql.connector
 from mysql.connector import Error
 import schedule
 import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.', '..')))
-from browser.broswerFunc import close_browser, create_browser
+from browser.broswerFunc import run_async
+from db.connectionPool import checkout_connection, log_query_stats, release_connection, timed_cursor
 from log import configure_logging
+from scripts.marketcheck import get_market_status
 
 
 #Loggin Setting
@@ -28,21 +28,17 @@ load_dotenv()
 
 
 # Update market status in the database
+# Not spooled: a status replayed after an outage would overwrite a newer one, and the next check rewrites it anyway
 def update_market_status(is_live):
-    cursor = 0
-    connection = 0
+    cursor = None
+    connection = None
     try:
         # Create database connection
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST'),
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE')
-        )
+        connection = checkout_connection()
         if connection.is_connected():
             logger.info("Database connection established successfully")
         
-        cursor = connection.cursor()
+        cursor = timed_cursor(connection)
         
         # Check if the record exists
         cursor.execute("SELECT * FROM application_config WHERE `key` = 'market_status'")
@@ -71,60 +67,31 @@ def update_market_status(is_live):
     except Error as e:
         logger.error(f"Error while updating database: {e}")
     finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+        release_connection(connection, cursor)
 
 # Main scraping function
 async def scrape_market_status():
-    browser = None
-    
     try:
-        browser = await create_browser()
-        page = await browser.newPage()
-        
-        # Set user agent
-        await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
-
-        website = 'https://www.nepalstock.com.np/'
-        
-        try:
-            await page.goto(website, {'waitUntil': 'networkidle0'})
-            logger.info("Page loaded successfully")
-
-            # Wait for the element to be visible
-            await page.waitForXPath('/html/body/app-root/div/main/div/app-dashboard/div[1]/div[1]/div/div[1]/div[1]/div[2]/span[2]', {'visible': True, 'timeout': 60000})
-            
-            # Get the text from the element
-            element = await page.xpath('/html/body/app-root/div/main/div/app-dashboard/div[1]/div[1]/div/div[1]/div[1]/div[2]/span[2]')
-            market_status_text = await page.evaluate('(element) => element.textContent', element[0])
-            
-            logger.info(f"Retrieved market status text: {market_status_text}")
+        # Force a fresh check without falling back to an old status; the result is also published to the live jobs
+        is_live = await get_market_status(ttl=0, max_stale=0)
+        if is_live is None:
+            logger.error("Market status could not be determined, database not updated")
+            return
 
-            # Check if the market is live
-            is_live = 1 if "Live Market" in market_status_text else 0
+        logger.info(f"Retrieved market status: {'Live' if is_live else 'Not Live'}")
 
-            # Update the database
-            update_market_status(is_live)
-
-        except Exception as e:
-            logger.error(f"An error occurred during scraping: {e}")
+        # Update the database
+        update_market_status(1 if is_live else 0)
 
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received. Exiting...")
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
-    finally:
-        if browser:
-            await close_browser(browser, page)
 
 # Schedule the scraping function to run every day at 11:20 AM
 def job():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(scrape_market_status())
-    loop.close()
+    run_async(scrape_market_status())
+    log_query_stats(logger)
 
 def marketStatus():
     while True: